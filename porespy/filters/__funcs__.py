@@ -1,20 +1,24 @@
+import os
+import tempfile
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import scipy as sp
 import numpy as np
 import scipy.ndimage as spim
 import scipy.spatial as sptl
-from scipy.signal import fftconvolve
 from tqdm import tqdm
-from numba import jit
+from numba import jit, prange
+from numpy.lib.format import open_memmap
 from skimage.segmentation import clear_border
 from skimage.morphology import ball, disk, square, cube, diamond, octahedron
-from skimage.morphology import reconstruction, watershed
-from porespy.tools import randomize_colors, fftmorphology
-from porespy.tools import get_border, extend_slice
-from porespy.tools import ps_disk, ps_ball
+from skimage.morphology import reconstruction
+from porespy.tools import morphology
+from porespy.tools import get_border, extend_slice, subdivide
+from porespy.tools import label_parallel
+from porespy.tools.__funcs__ import _union_labels_jit, _find_roots_jit
 
 
-def distance_transform_lin(im, axis=0, mode='both'):
+def distance_transform_lin(im, axis=0, mode='both', out=None, dtype=int):
     r"""
     Replaces each void voxel with the linear distance to the nearest solid
     voxel along the specified axis.
@@ -27,7 +31,8 @@ def distance_transform_lin(im, axis=0, mode='both'):
 
     axis : int
         The direction along which the distance should be measured, the default
-        is 0 (i.e. along the x-direction)
+        is 0 (i.e. along the x-direction).  If ``None`` is given then the
+        distance is measured along every axis and the minimum is reported.
 
     mode : string
         Controls how the distance is measured.  Options are:
@@ -38,40 +43,76 @@ def distance_transform_lin(im, axis=0, mode='both'):
         'reverse' - Distances are measured in the reverse direction.
         *'backward'* is also accepted.
 
-        'both' - Distances are calculated in both directions (by recursively
-        calling itself), then reporting the minimum value of the two results.
+        'both' - Distances are calculated in both directions and the minimum
+        value of the two results is reported.
+
+    out : ND-array, optional
+        An array the same shape as ``im`` into which the result is written.
+        If not given a new array is created.
+
+    dtype : data-type
+        The data type of the result if ``out`` is not given.  The default is
+        ``int``, but ``uint16`` or ``float32`` can be used to save memory.
 
     Returns
     -------
     image : ND-array
         A copy of ``im`` with each foreground voxel containing the distance to
         the nearest background along the specified axis.
+
+    Notes
+    -----
+    The distances are computed by a compiled kernel that sweeps each line of
+    voxels once in each direction, writing directly into ``out``, so no
+    temporary arrays the size of ``im`` are created other than a boolean
+    copy of ``im`` if it is not already boolean.
     """
     if mode in ['backward', 'reverse']:
-        im = sp.flip(im, axis)
-        im = distance_transform_lin(im=im, axis=axis, mode='forward')
-        im = sp.flip(im, axis)
-        return im
+        forward, backward = False, True
     elif mode in ['both']:
-        im_f = distance_transform_lin(im=im, axis=axis, mode='forward')
-        im_b = distance_transform_lin(im=im, axis=axis, mode='backward')
-        return sp.minimum(im_f, im_b)
+        forward, backward = True, True
+    elif mode in ['forward']:
+        forward, backward = True, False
     else:
-        b = sp.cumsum(im > 0, axis=axis)
-        c = sp.diff(b*(im == 0), axis=axis)
-        d = sp.minimum.accumulate(c, axis=axis)
-        if im.ndim == 1:
-            e = sp.pad(d, pad_width=[1, 0], mode='constant', constant_values=0)
-        elif im.ndim == 2:
-            ax = [[[1, 0], [0, 0]], [[0, 0], [1, 0]]]
-            e = sp.pad(d, pad_width=ax[axis], mode='constant', constant_values=0)
-        elif im.ndim == 3:
-            ax = [[[1, 0], [0, 0], [0, 0]],
-                  [[0, 0], [1, 0], [0, 0]],
-                  [[0, 0], [0, 0], [1, 0]]]
-            e = sp.pad(d, pad_width=ax[axis], mode='constant', constant_values=0)
-        f = im*(b + e)
-        return f
+        raise Exception('Unrecognized mode ' + mode)
+    if im.dtype != bool:
+        im = im > 0
+    if out is None:
+        out = sp.zeros(im.shape, dtype=dtype)
+    axes = range(im.ndim) if axis is None else [axis]
+    for i, ax in enumerate(axes):
+        im_ax = sp.moveaxis(im, ax, -1)
+        out_ax = sp.moveaxis(out, ax, -1)
+        while im_ax.ndim < 3:
+            im_ax = im_ax[sp.newaxis, ...]
+            out_ax = out_ax[sp.newaxis, ...]
+        _distance_transform_lin_jit(im_ax, out_ax, forward, backward, i == 0)
+    return out
+
+
+@jit(nopython=True, parallel=True)
+def _distance_transform_lin_jit(im, out, forward, backward, init):
+    r"""
+    Numba kernel for ``distance_transform_lin`` which counts the consecutive
+    foreground voxels along the last axis of ``im``, sweeping each line
+    forward and/or backward.  If ``init`` is False the result is combined
+    with the values already in ``out`` by taking the minimum.
+    """
+    Nx, Ny, Nz = im.shape
+    for i in prange(Nx):
+        for j in range(Ny):
+            if forward:
+                count = 0
+                for k in range(Nz):
+                    count = count + 1 if im[i, j, k] else 0
+                    if init or (count < out[i, j, k]):
+                        out[i, j, k] = count
+            if backward:
+                count = 0
+                for k in range(Nz - 1, -1, -1):
+                    count = count + 1 if im[i, j, k] else 0
+                    if (init and not forward) or (count < out[i, j, k]):
+                        out[i, j, k] = count
 
 
 def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
@@ -174,9 +215,8 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
         mask_solid = im > 0
     else:
         mask_solid = None
-    regions = watershed(image=-dt, markers=peaks, mask=mask_solid)
-    if randomize:
-        regions = randomize_colors(regions)
+    regions = marker_watershed(dt=dt, markers=peaks, mask=mask_solid,
+                               randomize=randomize)
     if return_all:
         tup.regions = regions
         return tup
@@ -184,6 +224,367 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
         return regions
 
 
+def marker_watershed(dt, markers, mask=None, randomize=False, out=None,
+                     return_stats=False):
+    r"""
+    Floods the distance transform outward from the given markers, from the
+    highest values to the lowest, so that each voxel receives the label of
+    the marker which reaches it first.
+
+    This performs the same flood as ``skimage.morphology.watershed`` applied
+    to ``-dt`` with face connectivity, but uses much less memory.  The two
+    only differ in how ties are broken between voxels of equal value, so
+    a small fraction of the voxels on the boundaries between regions may be
+    given the label of the other neighboring marker (see Notes).
+
+    Parameters
+    ----------
+    dt : ND-array
+        The distance transform of the pore space, or any image whose peaks
+        should be separated.  It is converted to ``float32``.
+    markers : ND-array
+        An image with the same shape as ``dt`` containing the integer label
+        of each marker, and 0 elsewhere.
+    mask : ND-array, optional
+        A boolean image indicating which voxels to label.  The default is to
+        label all voxels.
+    randomize : boolean
+        If ``True`` the labels are randomly shuffled as they are written,
+        which is helpful for visualization.  The default is ``False``.
+    out : ND-array, optional
+        An integer array into which the labels are written.  This may be
+        ``markers`` itself to label the image in place.  If not given, a new
+        ``int32`` array is created.
+    return_stats : boolean
+        If ``True`` the peak memory used by the priority queue, in bytes, is
+        also returned.  The default is ``False``.
+
+    Returns
+    -------
+    image : ND-array
+        The labeled image, which is ``out`` if it was given.  If
+        ``return_stats`` is ``True`` a tuple is returned containing the image
+        and the peak memory used by the queue.
+
+    Notes
+    -----
+    Voxels are visited using a priority queue implemented in a numba kernel.
+    Each voxel is labeled when it is first reached and added to the queue at
+    most once, with ties between equal values broken in the order the voxels
+    were reached.  skimage's implementation orders ties differently, which
+    is why the results are not identical on plateaus of ``dt`` shared by
+    two regions.  The queue only holds the current front of the flood, so
+    its peak memory usage, which can be obtained with ``return_stats``, is
+    usually a small fraction of the size of the image.
+
+    See Also
+    --------
+    snow_partitioning
+
+    """
+    if out is None:
+        out = sp.zeros(markers.shape, dtype=sp.int32)
+    N = int(markers.max())
+    lut = sp.arange(N + 1, dtype=sp.int64)
+    if randomize:
+        lut[1:] = sp.random.permutation(lut[1:])
+    if out is not markers:
+        out[...] = markers
+    if mask is None:
+        # An empty mask tells the kernel to label all voxels
+        mask = sp.zeros(0, dtype=bool)
+    shape = sp.atleast_3d(dt).shape
+    labels = sp.ravel(out)
+    seeds = sp.where(labels > 0)[0]
+    peak = _marker_watershed_jit(sp.ravel(dt).astype(sp.float32, copy=False),
+                                 sp.ravel(mask), labels, shape, seeds, lut)
+    if not sp.shares_memory(labels, out):
+        out[...] = sp.reshape(labels, out.shape)
+    if return_stats:
+        return out, peak*20
+    return out
+
+
+@jit(nopython=True)
+def _marker_watershed_jit(dt, mask, labels, shape, seeds, lut):
+    r"""
+    Numba kernel for ``marker_watershed`` which performs the flood on the
+    raveled images using a binary max-heap keyed on the ``dt`` value then
+    the order of insertion, doubling the size of the heap whenever it fills.
+    Returns the largest number of entries held in the heap.  An empty
+    ``mask`` means all voxels are labeled.
+    """
+    Nx, Ny, Nz = shape
+    use_mask = mask.size > 0
+    size = max(seeds.size, 1024)
+    keys = np.zeros(size, dtype=np.float32)
+    ages = np.zeros(size, dtype=np.int64)
+    inds = np.zeros(size, dtype=np.int64)
+    n = 0
+    peak = 0
+    nbrs = np.zeros(6, dtype=np.int64)
+    for s in seeds:
+        labels[s] = lut[labels[s]]
+    # The markers are pushed first, then each voxel as it is reached
+    todo = seeds[:seeds.size]
+    age = 0
+    while True:
+        for m in todo:
+            if n == keys.size:
+                keys = np.concatenate((keys, np.zeros_like(keys)))
+                ages = np.concatenate((ages, np.zeros_like(ages)))
+                inds = np.concatenate((inds, np.zeros_like(inds)))
+            key = dt[m]
+            p = n
+            n += 1
+            while p > 0:
+                c = (p - 1)//2
+                if keys[c] >= key:
+                    break
+                keys[p], ages[p], inds[p] = keys[c], ages[c], inds[c]
+                p = c
+            keys[p], ages[p], inds[p] = key, age, m
+            age += 1
+        peak = max(peak, n)
+        if n == 0:
+            break
+        # Pop the top of the heap
+        v = inds[0]
+        n -= 1
+        key, a, ind = keys[n], ages[n], inds[n]
+        p = 0
+        while True:
+            c = 2*p + 1
+            if c >= n:
+                break
+            if (c + 1 < n) and ((keys[c + 1] > keys[c])
+                                or ((keys[c + 1] == keys[c])
+                                    and (ages[c + 1] < ages[c]))):
+                c += 1
+            if (keys[c] > key) or ((keys[c] == key) and (ages[c] < a)):
+                keys[p], ages[p], inds[p] = keys[c], ages[c], inds[c]
+                p = c
+            else:
+                break
+        keys[p], ages[p], inds[p] = key, a, ind
+        # Label the unlabeled neighbors, which are pushed on the next pass
+        i = v // (Ny*Nz)
+        j = (v // Nz) % Ny
+        k = v % Nz
+        num = 0
+        if i > 0:
+            nbrs[num] = v - Ny*Nz
+            num += 1
+        if i < Nx - 1:
+            nbrs[num] = v + Ny*Nz
+            num += 1
+        if j > 0:
+            nbrs[num] = v - Nz
+            num += 1
+        if j < Ny - 1:
+            nbrs[num] = v + Nz
+            num += 1
+        if k > 0:
+            nbrs[num] = v - 1
+            num += 1
+        if k < Nz - 1:
+            nbrs[num] = v + 1
+            num += 1
+        found = 0
+        for q in range(num):
+            m = nbrs[q]
+            if (labels[m] == 0) and ((not use_mask) or mask[m]):
+                labels[m] = labels[v]
+                nbrs[found] = m
+                found += 1
+        todo = nbrs[:found]
+    return peak
+
+
+def snow_partitioning_parallel(im, divs=2, overlap=20, r_max=4, sigma=0.4,
+                               num_workers=None, filename=None):
+    r"""
+    Performs SNOW partitioning on overlapping tiles of the image in parallel,
+    then stitches the tiles into a single, globally labeled region image.
+
+    This allows images that are too large to be processed in memory at once
+    to be partitioned, since each tile only requires a distance transform,
+    peak search and watershed of its own.
+
+    Parameters
+    ----------
+    im : ND-array
+        A boolean image of the domain, with ``True`` indicating the pore space
+        and ``False`` elsewhere.  A memory-mapped array (i.e. ``numpy.memmap``)
+        is accepted, in which case only one tile per worker is ever read into
+        memory.
+    divs : int or array_like
+        The number of tiles to create along each axis.  If a scalar is given
+        it is used for all axes.  The default is 2.
+    overlap : int
+        The number of voxels by which each tile is extended beyond its core
+        on all sides (i.e. the halo).  This should be larger than the radius
+        of the largest pore in the image so that the distance transform and
+        the peaks found within the core of each tile are the same as those
+        that would be found on the full image.  The default is 20.
+    r_max : int
+        The radius of the spherical structuring element to use in the Maximum
+        filter stage that is used to find peaks.  The default is 4.
+    sigma : float
+        The standard deviation of the Gaussian filter applied to the distance
+        transform of each tile.  The default is 0.4.
+    num_workers : int
+        The number of processes to use.  The default is ``None`` which uses
+        all available cores.  If 1 is given, the tiles are processed serially
+        in the current process.
+    filename : string
+        The path of the ``.npy`` file in which the result is stored as a
+        memory-mapped array.  If not given (default) a temporary file is used
+        while stitching the tiles, which is removed before returning.
+
+    Returns
+    -------
+    image : ND-array
+        An array the same shape as ``im`` with the void space partitioned into
+        pore regions.  If ``filename`` was given this is a memory-mapped array
+        backed by that file, otherwise it is held in memory.
+
+    Notes
+    -----
+    Each region is labeled according to the location of the peak used as its
+    marker, so a region spanning the boundary between two tiles receives the
+    same label in both tiles, provided the peak is found by both.  If the
+    tiles find different peaks for the same pore, for instance due to edge
+    effects in the halo, the labels are reconciled after all tiles are done.
+    The labels each tile assigned to the layer of voxels just outside its
+    core are compared with the labels written there by the neighboring tile,
+    and labels which are each other's most frequent partner are merged
+    using a disjoint-set forest.  The regions are then renumbered
+    contiguously in a second pass over the tiles.
+
+    See Also
+    --------
+    snow_partitioning
+    porespy.tools.subdivide
+
+    """
+    im_shape = sp.array(im.shape)
+    if isinstance(divs, int):
+        divs = [divs for i in range(im.ndim)]
+    temp = filename is None
+    if temp:
+        fd, filename = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    slices = [tuple(s) for s in subdivide(im, divs=divs).flatten()]
+    chunks = [extend_slice(s, shape=im_shape, pad=overlap) for s in slices]
+    print('_'*60)
+    print('Partitioning', len(chunks), 'tiles using', num_workers, 'workers')
+    pool = None
+    try:
+        regions = open_memmap(filename, mode='w+', dtype=sp.int32,
+                              shape=tuple(im_shape))
+        if num_workers > 1:
+            pool = ProcessPoolExecutor(max_workers=num_workers)
+        peak_ids = {}  # Global label of each peak location, in order found
+        shells = []  # Labels each tile found just outside its core
+        # Only read as many tiles as there are workers to limit memory usage
+        for n in tqdm(range(0, len(chunks), num_workers)):
+            batch = range(n, min(n + num_workers, len(chunks)))
+            args = [(im[chunks[i]], r_max, sigma, slices[i], chunks[i], im_shape)
+                    for i in batch]
+            if pool is None:
+                results = map(_snow_chunk, args)
+            else:
+                results = pool.map(_snow_chunk, args)
+            for i, (labels, keys, halo) in zip(batch, results):
+                lut = sp.zeros(shape=(len(keys) + 1, ), dtype=sp.int32)
+                for j, k in enumerate(keys):
+                    lut[j + 1] = peak_ids.setdefault(k, len(peak_ids) + 1)
+                regions[slices[i]] = lut[labels]
+                shells.extend([(s, lut[h]) for s, h in halo])
+        # Merge the labels given to the same pore by neighboring tiles
+        parent = sp.arange(len(peak_ids) + 1, dtype=sp.int64)
+        for s, labels in shells:
+            a, b = _seam_pairs(labels, regions[s])
+            _union_labels_jit(parent, a, b)
+        roots = _find_roots_jit(parent)
+        # Renumber the merged labels contiguously, tile by tile
+        present = sp.zeros(len(peak_ids) + 1, dtype=bool)
+        for s in slices:
+            present[regions[s]] = True
+        present[0] = False
+        lut = sp.zeros_like(roots)
+        keep = sp.unique(roots[present])
+        lut[keep] = sp.arange(1, keep.size + 1)
+        lut = lut[roots].astype(sp.int32)
+        for s in slices:
+            regions[s] = lut[regions[s]]
+        regions.flush()
+        if temp:
+            # Copy the result into memory so the temporary file can be removed
+            regions = sp.array(regions)
+        print('Number of regions after stitching: ', keep.size)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if temp:
+            os.remove(filename)
+    return regions
+
+
+def _seam_pairs(a, b):
+    r"""
+    Helper function for ``snow_partitioning_parallel`` which compares two
+    sets of labels for the same voxels and returns the pairs of labels that
+    are each other's most frequent partner.
+    """
+    mask = (a > 0)*(b > 0)
+    pairs = sp.vstack((a[mask], b[mask])).astype(sp.int64)
+    if pairs.size == 0:
+        return pairs[0], pairs[1]
+    pairs, counts = sp.unique(pairs, axis=1, return_counts=True)
+    pairs = pairs[:, sp.argsort(-counts, kind='mergesort')]
+    # The first occurrence of each label is its most frequent partner
+    ia = sp.unique(pairs[0], return_index=True)[1]
+    ib = sp.unique(pairs[1], return_index=True)[1]
+    mutual = sp.intersect1d(ia, ib)
+    return pairs[0, mutual], pairs[1, mutual]
+
+
+def _snow_chunk(args):
+    r"""
+    Helper function for ``snow_partitioning_parallel`` which partitions a
+    single tile, then returns the core of the tile along with the global
+    location of each marker (as a flat index into the full image), and the
+    labels found in the layer of voxels just outside each face of the core.
+    """
+    im, r_max, sigma, core, chunk, shape = args
+    tup = snow_partitioning(im=im, r_max=r_max, sigma=sigma, return_all=True,
+                            randomize=False)
+    N = tup.peaks.max()
+    crds = spim.center_of_mass(tup.peaks > 0, labels=tup.peaks,
+                               index=sp.arange(1, N + 1))
+    crds = sp.floor(sp.reshape(crds, (N, im.ndim))).astype(int)
+    crds += [c.start for c in chunk]
+    keys = sp.ravel_multi_index(tuple(crds.T), dims=shape)
+    # Extract the core of the tile, relative to the extended slice
+    s = tuple([slice(a.start - b.start, a.stop - b.start)
+               for a, b in zip(core, chunk)])
+    labels = tup.regions[s].astype(sp.int32)
+    halo = []
+    for ax in range(im.ndim):
+        for i in [core[ax].start - 1, core[ax].stop]:
+            if chunk[ax].start <= i < chunk[ax].stop:
+                shell = list(core)
+                shell[ax] = slice(i, i + 1)
+                local = tuple([slice(a.start - b.start, a.stop - b.start)
+                               for a, b in zip(shell, chunk)])
+                halo.append((tuple(shell), tup.regions[local]))
+    return labels, keys, halo
+
+
 def find_peaks(dt, r_max=4, footprint=None):
     r"""
     Returns all local maxima in the distance transform
@@ -297,39 +698,133 @@ def trim_saddle_points(peaks, dt, max_iters=10):
     -------
     image : ND-array
         An image with fewer peaks than the input image
+
+    Notes
+    -----
+    Each cluster of peak voxels is grown outward one voxel at a time (within
+    a box extending 10 voxels beyond the cluster) until it reaches a voxel
+    with a higher distance transform value, in which case it is a saddle
+    point and is removed.  A flat cluster with no immediate neighbor of
+    equal or higher value is a true peak and is kept straight away.  All
+    clusters are handled at once: those decided by their immediate
+    neighbors (the vast majority) are found using a single pass over the
+    peak voxels, and the remainder are grown by a breadth-first search in a
+    numba kernel.  Clusters which do not reach a higher voxel within
+    ``max_iters`` are kept.
     """
     peaks = sp.copy(peaks)
-    if dt.ndim == 2:
-        from skimage.morphology import square as cube
-    else:
-        from skimage.morphology import cube
     labels, N = spim.label(peaks)
-    slices = spim.find_objects(labels)
-    for i in range(N):
-        s = extend_slice(s=slices[i], shape=peaks.shape, pad=10)
-        peaks_i = labels[s] == i+1
-        dt_i = dt[s]
-        im_i = dt_i > 0
-        iters = 0
-        peaks_dil = sp.copy(peaks_i)
-        while iters < max_iters:
-            iters += 1
-            peaks_dil = spim.binary_dilation(input=peaks_dil,
-                                             structure=cube(3))
-            peaks_max = peaks_dil*sp.amax(dt_i*peaks_dil)
-            peaks_extended = (peaks_max == dt_i)*im_i
-            if sp.all(peaks_extended == peaks_i):
-                break  # Found a true peak
-            elif sp.sum(peaks_extended*peaks_i) == 0:
-                peaks_i = False
-                break  # Found a saddle point
-        peaks[s] = peaks_i
-        if iters >= max_iters:
-            print('Maximum number of iterations reached, consider'
-                  + 'running again with a larger value of max_iters')
+    if N == 0:
+        return peaks
+    index = sp.arange(1, N + 1)
+    dt3 = sp.atleast_3d(dt).astype(float)
+    labels3 = sp.atleast_3d(labels)
+    crds = sp.vstack(sp.where(labels3)).T
+    vmax, vmin, m1, tied = _peak_neighbors_jit(dt3, labels3, crds, N)
+    # Saddle points with a higher immediate neighbor are removed outright,
+    # and flat peaks with only lower immediate neighbors are kept
+    remove = m1 > vmax
+    keep = (vmin == vmax)*~tied*~remove
+    iters = sp.ones(N, dtype=int)
+    todo = index[~remove*~keep]
+    if todo.size > 0:
+        slices = spim.find_objects(labels)
+        boxes = sp.zeros((N, 6), dtype=int)
+        for i in todo - 1:
+            s = extend_slice(s=slices[i], shape=peaks.shape, pad=10)
+            s = list(s) + [slice(0, 1)]*(3 - peaks.ndim)
+            boxes[i] = [v for d in s[:3] for v in (d.start, d.stop)]
+        found = _grow_peaks_jit(dt3, labels3, boxes, vmax, todo, max_iters)
+        remove[todo - 1] = found > 0
+        iters[todo - 1] = sp.where(found > 0, found, max_iters)
+    print('Saddle points found: ', sp.sum(remove), 'of', N, 'peaks, using',
+          sp.amax(iters), 'iterations at most')
+    if sp.any(iters >= max_iters):
+        print('Maximum number of iterations reached, consider '
+              + 'running again with a larger value of max_iters')
+    remove = sp.concatenate([[False], remove])
+    peaks[remove[labels]] = 0
     return peaks
 
 
+@jit(nopython=True)
+def _peak_neighbors_jit(dt, labels, crds, N):
+    r"""
+    Helper function for ``trim_saddle_points`` which finds the maximum and
+    minimum distance transform value in each cluster of peaks, the maximum
+    among their immediate neighbors, and whether any immediate neighbor
+    outside the cluster ties with the cluster's maximum.
+    """
+    Nx, Ny, Nz = dt.shape
+    vmax = np.zeros(N, dtype=np.float64)
+    vmin = np.full(N, np.inf)
+    m1 = np.zeros(N, dtype=np.float64)
+    tied = np.zeros(N, dtype=np.bool_)
+    for n in range(crds.shape[0]):
+        i, j, k = crds[n]
+        L = labels[i, j, k] - 1
+        vmax[L] = max(vmax[L], dt[i, j, k])
+        vmin[L] = min(vmin[L], dt[i, j, k])
+    for n in range(crds.shape[0]):
+        i, j, k = crds[n]
+        L = labels[i, j, k] - 1
+        for x in range(max(i - 1, 0), min(i + 2, Nx)):
+            for y in range(max(j - 1, 0), min(j + 2, Ny)):
+                for z in range(max(k - 1, 0), min(k + 2, Nz)):
+                    m1[L] = max(m1[L], dt[x, y, z])
+                    other = labels[x, y, z] != L + 1
+                    if other and (dt[x, y, z] == vmax[L]):
+                        tied[L] = True
+    return vmax, vmin, m1, tied
+
+
+@jit(nopython=True)
+def _grow_peaks_jit(dt, labels, boxes, vmax, todo, max_iters):
+    r"""
+    Helper function for ``trim_saddle_points`` which grows each cluster of
+    peaks listed in ``todo`` one layer of voxels at a time, using a
+    breadth-first search over the 26 neighbors restricted to the cluster's
+    box.  Returns the iteration at which a voxel higher than the cluster was
+    reached, or -1 if this did not happen within ``max_iters``.
+    """
+    found = -np.ones(todo.size, dtype=np.int64)
+    for t in range(todo.size):
+        L = todo[t]
+        x0, x1, y0, y1, z0, z1 = boxes[L - 1]
+        nx, ny, nz = x1 - x0, y1 - y0, z1 - z0
+        dist = -np.ones((nx, ny, nz), dtype=np.int64)
+        queue = np.zeros(nx*ny*nz, dtype=np.int64)
+        head = 0
+        tail = 0
+        for i in range(nx):
+            for j in range(ny):
+                for k in range(nz):
+                    if labels[x0 + i, y0 + j, z0 + k] == L:
+                        dist[i, j, k] = 0
+                        queue[tail] = (i*ny + j)*nz + k
+                        tail += 1
+        while head < tail and found[t] < 0:
+            n = queue[head]
+            head += 1
+            i = n // (ny*nz)
+            j = (n // nz) % ny
+            k = n % nz
+            d = dist[i, j, k] + 1
+            if d > max_iters:
+                break
+            for x in range(max(i - 1, 0), min(i + 2, nx)):
+                for y in range(max(j - 1, 0), min(j + 2, ny)):
+                    for z in range(max(k - 1, 0), min(k + 2, nz)):
+                        if dist[x, y, z] >= 0:
+                            continue
+                        dist[x, y, z] = d
+                        queue[tail] = (x*ny + y)*nz + z
+                        tail += 1
+                        if dt[x0 + x, y0 + y, z0 + z] > vmax[L - 1]:
+                            found[t] = d
+    return found
+
+
 def trim_nearby_peaks(peaks, dt):
     r"""
     Finds pairs of peaks that are nearer to each other than to the solid phase,
@@ -355,7 +850,8 @@ def trim_nearby_peaks(peaks, dt):
     -----
     Each pair of peaks is considered simultaneously, so for a triplet of peaks
     each pair is considered.  This ensures that only the single peak that is
-    furthest from the solid is kept.  No iteration is required.
+    furthest from the solid is kept.  No iteration is required, and the
+    dropped peaks are removed from the label image in a single lookup.
     """
     peaks = sp.copy(peaks)
     if dt.ndim == 2:
@@ -363,6 +859,8 @@ def trim_nearby_peaks(peaks, dt):
     else:
         from skimage.morphology import cube
     peaks, N = spim.label(peaks, structure=cube(3))
+    if N < 2:
+        return (peaks > 0)
     crds = spim.measurements.center_of_mass(peaks, labels=peaks,
                                             index=sp.arange(1, N+1))
     crds = sp.vstack(crds).astype(int)  # Convert to numpy array of ints
@@ -374,22 +872,23 @@ def trim_nearby_peaks(peaks, dt):
     del temp, tree  # Free-up memory
     dist_to_solid = dt[tuple(crds.T)]  # Get distance to solid for each peak
     hits = sp.where(dist_to_neighbor < dist_to_solid)[0]
-    # Drop peak that is closer to the solid than it's neighbor
-    drop_peaks = []
-    for peak in hits:
-        if dist_to_solid[peak] < dist_to_solid[nearest_neighbor[peak]]:
-            drop_peaks.append(peak)
-        else:
-            drop_peaks.append(nearest_neighbor[peak])
-    drop_peaks = sp.unique(drop_peaks)
-    # Remove peaks from image
-    slices = spim.find_objects(input=peaks)
-    for s in drop_peaks:
-        peaks[slices[s]] = 0
-    return (peaks > 0)
-
-
-def find_disconnected_voxels(im, conn=None):
+    # Drop peak that is closer to the solid than it's neighbor, or the one
+    # with the higher label if both are equally close so that mutual
+    # neighbors do not remove each other
+    neighbors = nearest_neighbor[hits]
+    d_hit = dist_to_solid[hits]
+    d_nbr = dist_to_solid[neighbors]
+    drop_peaks = sp.where(d_hit < d_nbr, hits, neighbors)
+    ties = d_hit == d_nbr
+    drop_peaks[ties] = sp.maximum(hits[ties], neighbors[ties])
+    # Remove peaks from image using a lookup table over the labels
+    keep = sp.ones(N + 1, dtype=bool)
+    keep[0] = False
+    keep[drop_peaks + 1] = False
+    return keep[peaks]
+
+
+def find_disconnected_voxels(im, conn=None, num_workers=1):
     r"""
     This identifies all pore (or solid) voxels that are not connected to the
     edge of the image.  This can be used to find blind pores, or remove
@@ -406,6 +905,11 @@ def find_disconnected_voxels(im, conn=None):
         for the 3D the options are 6 and 26, similarily for square and diagonal
         neighbors.  The default is max
 
+    num_workers : int
+        The number of processes used to label the image, which is divided
+        into slabs along the first axis.  The default is 1.  If ``None`` all
+        available cores are used.
+
     Returns
     -------
     image : ND-array
@@ -419,6 +923,10 @@ def find_disconnected_voxels(im, conn=None):
         The returned array (e.g. ``holes``) be used to trim blind pores from
         ``im`` using: ``im[holes] = False``
 
+    See Also
+    --------
+    porespy.tools.label_parallel
+
     """
     if im.ndim == 2:
         if conn == 4:
@@ -430,12 +938,14 @@ def find_disconnected_voxels(im, conn=None):
             strel = ball(1)
         elif conn in [None, 26]:
             strel = cube(3)
-    labels, N = spim.label(input=im, structure=strel)
-    holes = clear_border(labels=labels) > 0
-    return holes
+    tup = label_parallel(im, structure=strel, num_workers=num_workers)
+    # Labels touching none of the faces are holes
+    holes = ~sp.any(tup.faces, axis=1)
+    holes[0] = False
+    return holes[tup.labels]
 
 
-def fill_blind_pores(im):
+def fill_blind_pores(im, num_workers=1):
     r"""
     Fills all pores that are not connected to the edges of the image.
 
@@ -444,6 +954,10 @@ def fill_blind_pores(im):
     im : ND-array
         The image of the porous material
 
+    num_workers : int
+        The number of processes used to label the image.  The default is 1.
+        See ``find_disconnected_voxels``.
+
     Returns
     -------
     image : ND-array
@@ -455,12 +969,12 @@ def fill_blind_pores(im):
 
     """
     im = sp.copy(im)
-    holes = find_disconnected_voxels(im)
+    holes = find_disconnected_voxels(im, num_workers=num_workers)
     im[holes] = False
     return im
 
 
-def trim_floating_solid(im):
+def trim_floating_solid(im, num_workers=1):
     r"""
     Removes all solid that that is not attached to the edges of the image.
 
@@ -469,6 +983,10 @@ def trim_floating_solid(im):
     im : ND-array
         The image of the porous material
 
+    num_workers : int
+        The number of processes used to label the image.  The default is 1.
+        See ``find_disconnected_voxels``.
+
     Returns
     -------
     image : ND-array
@@ -480,12 +998,13 @@ def trim_floating_solid(im):
 
     """
     im = sp.copy(im)
-    holes = find_disconnected_voxels(~im)
+    holes = find_disconnected_voxels(~im, num_workers=num_workers)
     im[holes] = True
     return im
 
 
-def trim_nonpercolating_paths(im, inlet_axis=0, outlet_axis=0):
+def trim_nonpercolating_paths(im, inlet_axis=0, outlet_axis=0,
+                              num_workers=1):
     r"""
     Removes all nonpercolating paths between specified edges
 
@@ -509,6 +1028,10 @@ def trim_nonpercolating_paths(im, inlet_axis=0, outlet_axis=0):
         number ranges from 0 to 2. For two dimensional image the range is
         between 0 to 1.
 
+    num_workers : int
+        The number of processes used to label the image.  The default is 1.
+        If ``None`` all available cores are used.
+
     Returns
     -------
     image : ND-array
@@ -521,39 +1044,13 @@ def trim_nonpercolating_paths(im, inlet_axis=0, outlet_axis=0):
     trim_blind_pores
 
     """
-    im = trim_floating_solid(~im)
-    labels = spim.label(~im)[0]
-    inlet = sp.zeros_like(im, dtype=int)
-    outlet = sp.zeros_like(im, dtype=int)
-    if im.ndim == 3:
-        if inlet_axis == 0:
-            inlet[0, :, :] = 1
-        elif inlet_axis == 1:
-            inlet[:, 0, :] = 1
-        elif inlet_axis == 2:
-            inlet[:, :, 0] = 1
-
-        if outlet_axis == 0:
-            outlet[-1, :, :] = 1
-        elif outlet_axis == 1:
-            outlet[:, -1, :] = 1
-        elif outlet_axis == 2:
-            outlet[:, :, -1] = 1
-
-    if im.ndim == 2:
-        if inlet_axis == 0:
-            inlet[0, :] = 1
-        elif inlet_axis == 1:
-            inlet[:, 0] = 1
-
-        if outlet_axis == 0:
-            outlet[-1, :] = 1
-        elif outlet_axis == 1:
-            outlet[:, -1] = 1
-    IN = sp.unique(labels*inlet)
-    OUT = sp.unique(labels*outlet)
-    new_im = sp.isin(labels, list(set(IN) ^ set(OUT)), invert=True)
-    im[new_im == 0] = True
+    im = trim_floating_solid(~im, num_workers=num_workers)
+    tup = label_parallel(~im, num_workers=num_workers)
+    inlet = tup.faces[:, 2*inlet_axis]
+    outlet = tup.faces[:, 2*outlet_axis + 1]
+    # Labels touching only one of the inlet and outlet are removed
+    trim = inlet ^ outlet
+    im[trim[tup.labels]] = True
     return ~im
 
 
@@ -592,7 +1089,6 @@ def trim_extrema(im, h, mode='maxima'):
     return result
 
 
-@jit(forceobj=True)
 def flood(im, regions=None, mode='max'):
     r"""
     Floods/fills each region in an image with a single value based on the
@@ -619,6 +1115,15 @@ def flood(im, regions=None, mode='max'):
 
         'size' - Floods each region with the size of that region
 
+        'sum' - Floods each region with the sum of the values in that region
+
+        'mean' - Floods each region with the mean value in that region
+
+        'median' - Floods each region with the median value in that region
+
+        'std' - Floods each region with the standard deviation of the values
+        in that region
+
     Returns
     -------
     image : ND-array
@@ -629,35 +1134,90 @@ def flood(im, regions=None, mode='max'):
     --------
     props_to_image
 
+    Notes
+    -----
+    The per-region values are found with ``numpy.bincount`` or a compiled
+    kernel operating on flattened views of ``im`` and ``regions``, so no
+    copies of the images are made other than the returned result.
+
     """
     mask = im > 0
     if regions is None:
         labels, N = spim.label(mask)
     else:
-        labels = sp.copy(regions)
-        N = labels.max()
-    I = im.flatten()
-    L = labels.flatten()
+        labels = regions
+        N = int(labels.max())
+    vals = sp.ravel(im)
+    # bincount cannot cast unsigned 64 bit labels, so use the native index type
+    L = sp.ravel(labels).astype(sp.intp, copy=False)
     if mode.startswith('max'):
-        V = sp.zeros(shape=N+1, dtype=float)
-        for i in range(len(L)):
-            if V[L[i]] < I[i]:
-                V[L[i]] = I[i]
+        V = _flood_extrema_jit(vals.astype(float, copy=False), L, N, True)
     elif mode.startswith('min'):
-        V = sp.ones(shape=N+1, dtype=float)*sp.inf
-        for i in range(len(L)):
-            if V[L[i]] > I[i]:
-                V[L[i]] = I[i]
+        V = _flood_extrema_jit(vals.astype(float, copy=False), L, N, False)
     elif mode.startswith('size'):
-        V = sp.zeros(shape=N+1, dtype=int)
-        for i in range(len(L)):
-            V[L[i]] += 1
-    im_flooded = sp.reshape(V[labels], newshape=im.shape)
-    im_flooded = im_flooded*mask
+        V = sp.bincount(L, minlength=N+1)
+    elif mode.startswith('sum'):
+        V = sp.bincount(L, weights=vals, minlength=N+1)
+    elif mode.startswith('mean'):
+        V = sp.bincount(L, weights=vals, minlength=N+1)
+        V = V/sp.maximum(sp.bincount(L, minlength=N+1), 1)
+    elif mode.startswith('median'):
+        V = sp.zeros(shape=N+1, dtype=float)
+        V[1:] = spim.median(vals, labels=L, index=sp.arange(1, N+1))
+    elif mode.startswith('std'):
+        V = _flood_std_jit(vals.astype(float, copy=False), L, N)
+    else:
+        raise Exception('Unrecognized mode ' + mode)
+    im_flooded = V[labels]
+    im_flooded[~mask] = 0
     return im_flooded
 
 
-def find_dt_artifacts(dt):
+@jit(nopython=True, cache=True)
+def _flood_extrema_jit(vals, L, N, find_max):
+    r"""
+    Helper function for ``flood`` which finds the maximum (or minimum) value
+    of ``vals`` within each label of ``L``.  Labels with no voxels get 0.
+    """
+    V = np.zeros(N + 1, dtype=np.float64)
+    seen = np.zeros(N + 1, dtype=np.bool_)
+    for i in range(L.size):
+        n = L[i]
+        v = vals[i]
+        if not seen[n]:
+            V[n] = v
+            seen[n] = True
+        elif find_max and (v > V[n]):
+            V[n] = v
+        elif (not find_max) and (v < V[n]):
+            V[n] = v
+    return V
+
+
+@jit(nopython=True, cache=True)
+def _flood_std_jit(vals, L, N):
+    r"""
+    Helper function for ``flood`` which finds the standard deviation of the
+    values of ``vals`` within each label of ``L`` in a single pass, using
+    Welford's running update of the mean.
+    """
+    n = np.zeros(N + 1, dtype=np.int64)
+    mean = np.zeros(N + 1, dtype=np.float64)
+    m2 = np.zeros(N + 1, dtype=np.float64)
+    for i in range(vals.size):
+        R = L[i]
+        n[R] += 1
+        d = vals[i] - mean[R]
+        mean[R] += d/n[R]
+        m2[R] += d*(vals[i] - mean[R])
+    V = np.zeros(N + 1, dtype=np.float64)
+    for R in range(N + 1):
+        if n[R] > 0:
+            V[R] = np.sqrt(m2[R]/n[R])
+    return V
+
+
+def find_dt_artifacts(dt, chunk_size=None):
     r"""
     Finds points in a distance transform that are closer to wall than solid.
 
@@ -670,6 +1230,11 @@ def find_dt_artifacts(dt):
     dt : ND-array
         The distance transform of the phase of interest
 
+    chunk_size : int, optional
+        The number of slices along the first axis to process at once.  The
+        default is to process the whole image at once, but a smaller value
+        limits the size of the temporary arrays that are created.
+
     Returns
     -------
     image : ND-array
@@ -681,12 +1246,23 @@ def find_dt_artifacts(dt):
         the image.  Obviously, voxels with a value of zero have no error.
 
     """
-    temp = sp.ones(shape=dt.shape)*sp.inf
-    for ax in range(dt.ndim):
-        dt_lin = distance_transform_lin(sp.ones_like(temp, dtype=bool),
-                                        axis=ax, mode='both')
-        temp = sp.minimum(temp, dt_lin)
-    result = sp.clip(dt - temp, a_min=0, a_max=sp.inf)
+    # Distance from each voxel to the nearest face along each axis, shaped
+    # to broadcast against the image
+    faces = []
+    for ax, n in enumerate(dt.shape):
+        i = sp.arange(n)
+        shape = [1]*dt.ndim
+        shape[ax] = n
+        faces.append(sp.reshape(sp.minimum(i + 1, n - i), shape))
+    result = sp.zeros(dt.shape, dtype=float)
+    if chunk_size is None:
+        chunk_size = dt.shape[0]
+    for a in range(0, dt.shape[0], chunk_size):
+        b = min(a + chunk_size, dt.shape[0])
+        temp = faces[0][a:b]
+        for f in faces[1:]:
+            temp = sp.minimum(temp, f)
+        result[a:b] = sp.clip(dt[a:b] - temp, a_min=0, a_max=sp.inf)
     return result
 
 
@@ -717,7 +1293,8 @@ def region_size(im):
     return chords
 
 
-def apply_chords(im, spacing=1, axis=0, trim_edges=True, label=False):
+def apply_chords(im, spacing=1, axis=0, trim_edges=True, label=False,
+                 num_workers=1):
     r"""
     Adds chords to the void space in the specified direction.  The chords are
     separated by 1 voxel plus the provided spacing.
@@ -746,6 +1323,11 @@ def apply_chords(im, spacing=1, axis=0, trim_edges=True, label=False):
         value.  This is automatically set to ``True`` if spacing is 0, but is
         ``False`` otherwise.
 
+    num_workers : int
+        The number of processes used to label the chords, which is done on
+        slabs along the first axis using ``porespy.tools.label_parallel``.
+        The default is 1.  If ``None`` all available cores are used.
+
     Returns
     -------
     image : ND-array
@@ -769,9 +1351,10 @@ def apply_chords(im, spacing=1, axis=0, trim_edges=True, label=False):
                    mode='constant', constant_values=0)
     im = im[slices]
     s = sp.swapaxes(s, 0, axis)
-    chords = spim.label(im, structure=s)[0]
+    tup = label_parallel(im, structure=s, num_workers=num_workers)
+    chords = tup.labels
     if trim_edges:  # Label on border chords will be set to 0
-        chords = clear_border(chords)
+        chords[sp.any(tup.faces, axis=1)[chords]] = 0
     result[slices] = chords  # Place chords into empty image created at top
     if label is False:  # Remove label if not requested
         result = result > 0
@@ -830,7 +1413,7 @@ def apply_chords_3D(im, spacing=0, trim_edges=True):
     return chords
 
 
-def local_thickness(im, sizes=25, mode='hybrid'):
+def local_thickness(im, sizes=25, mode='hybrid', max_memory=None):
     r"""
     For each voxel, this functions calculates the radius of the largest sphere
     that both engulfs the voxel and fits entirely within the foreground. This
@@ -845,15 +1428,18 @@ def local_thickness(im, sizes=25, mode='hybrid'):
     sizes : array_like or scalar
         The sizes to invade.  If a list of values of provided they are used
         directly.  If a scalar is provided then that number of points spanning
-        the min and max of the distance transform are used.
+        the min and max of the distance transform are used.  If ``mode`` is
+        'sort' then ``None`` can be given to use the exact distance transform
+        values.
 
     mode : string
         Controls with method is used to compute the result.  Options are:
 
         'hybrid' - (default) Performs a distance tranform of the void space,
         thresholds to find voxels larger than ``sizes[i]``, trims the resulting
-        mask if ``access_limitations`` is ``True``, then dilates it using the
-        efficient fft-method to obtain the non-wetting fluid configuration.
+        mask if ``access_limitations`` is ``True``, then dilates it using
+        ``porespy.tools.morphology`` to obtain the non-wetting fluid
+        configuration.
 
         'dt' - Same as 'hybrid', except uses a second distance transform,
         relative to the thresholded mask, to find the invading fluid
@@ -865,6 +1451,22 @@ def local_thickness(im, sizes=25, mode='hybrid'):
         ``access_limitations`` is ``True``.  This method is not ideal and is
         included mostly for comparison purposes.
 
+        'sort' - Visits the voxels in order of decreasing distance transform
+        value and inserts a sphere at each, requiring only a single pass over
+        the image regardless of the number of ``sizes``.
+
+        'exact' - Finds the exact local thickness by placing spheres only on
+        the ridge voxels of the distance transform (i.e. those whose sphere
+        is not contained in the sphere of a neighbor), following the method
+        of Hildebrand and Ruegsegger.  The spheres are inserted in parallel
+        using all threads available to numba.  ``sizes`` is ignored.
+
+    max_memory : int
+        The approximate number of bytes to use for storing sphere centers when
+        ``mode`` is 'exact'.  The image is processed in slabs along the first
+        axis so that the centers found in each slab fit within this limit.
+        The default is ``None``, which processes the whole image at once.
+
     Returns
     -------
     image : ND-array
@@ -876,13 +1478,103 @@ def local_thickness(im, sizes=25, mode='hybrid'):
     pore space or the solid, whichever is set to True.
 
     This function is identical to porosimetry with ``access_limited`` set to
-    ``False``.
+    ``False``, except for the 'exact' mode which is only available here.
+
+    References
+    ----------
+    [1] Hildebrand T, Ruegsegger P. A new method for the model-independent
+    assessment of thickness in three-dimensional images. Journal of
+    Microscopy. 185(1), 67-75 (1997).
 
     """
+    if mode == 'exact':
+        dt = spim.distance_transform_edt(im > 0)
+        return _local_thickness_exact(dt, max_memory=max_memory)
     im_new = porosimetry(im=im, sizes=sizes, access_limited=False, mode=mode)
     return im_new
 
 
+def _local_thickness_exact(dt, max_memory=None):
+    r"""
+    Helper function for ``local_thickness`` which finds the ridge voxels of
+    the distance transform one slab at a time and inserts their spheres.
+    """
+    dt3 = sp.atleast_3d(dt).astype(float)
+    result = sp.zeros(dt3.shape, dtype=float)
+    Nx, Ny, Nz = dt3.shape
+    R = int(sp.ceil(dt3.max()))
+    step = Nx
+    if max_memory is not None:
+        # Each center requires 3 coordinates and 1 radius of 8 bytes each
+        step = int(max(1, min(Nx, max_memory // (32*Ny*Nz))))
+    for a in range(0, Nx, step):
+        b = min(a + step, Nx)
+        ridge = sp.zeros((b - a, Ny, Nz), dtype=bool)
+        _find_ridge_jit(dt3, a, ridge)
+        ci, cj, ck = sp.where(ridge)
+        cr = dt3[a:b][ci, cj, ck]
+        del ridge
+        ci += a
+        offsets = sp.searchsorted(ci, sp.arange(a, b + 1))
+        _insert_ridge_spheres_jit(ci, cj, ck, cr, offsets, a, R, result)
+    return sp.reshape(result, dt.shape)
+
+
+@jit(nopython=True, parallel=True)
+def _find_ridge_jit(dt, a, ridge):
+    r"""
+    Numba kernel for ``_local_thickness_exact`` which flags the voxels in the
+    slab starting at ``a`` whose sphere is not contained within the sphere
+    of any of their 26 neighbors.
+    """
+    Nx, Ny, Nz = dt.shape
+    for i in prange(a, a + ridge.shape[0]):
+        for j in range(Ny):
+            for k in range(Nz):
+                r = dt[i, j, k]
+                if r == 0:
+                    continue
+                keep = True
+                for x in range(max(i - 1, 0), min(i + 2, Nx)):
+                    for y in range(max(j - 1, 0), min(j + 2, Ny)):
+                        for z in range(max(k - 1, 0), min(k + 2, Nz)):
+                            d = np.sqrt((x - i)**2 + (y - j)**2 + (z - k)**2)
+                            if (d > 0) and (dt[x, y, z] >= r + d):
+                                keep = False
+                ridge[i - a, j, k] = keep
+
+
+@jit(nopython=True, parallel=True)
+def _insert_ridge_spheres_jit(ci, cj, ck, cr, offsets, a, R, result):
+    r"""
+    Numba kernel for ``_local_thickness_exact``.  The centers are sorted
+    along the first axis and ``offsets`` gives the range of centers lying in
+    each plane of the slab, so each thread writes a single plane of
+    ``result`` at a time and only visits the centers within ``R`` of it.
+    """
+    Nx, Ny, Nz = result.shape
+    b = a + offsets.size - 1
+    for x in prange(max(a - R, 0), min(b + R, Nx)):
+        for p in range(max(x - R, a), min(x + R + 1, b)):
+            dx2 = (x - p)**2
+            for n in range(offsets[p - a], offsets[p - a + 1]):
+                r = cr[n]
+                if dx2 >= r*r:
+                    continue
+                Rn = int(np.ceil(r))
+                j = cj[n]
+                k = ck[n]
+                for y in range(max(j - Rn, 0), min(j + Rn + 1, Ny)):
+                    rem = r*r - dx2 - (y - j)**2
+                    if rem <= 0:
+                        continue
+                    Rz = int(np.ceil(np.sqrt(rem)))
+                    for z in range(max(k - Rz, 0), min(k + Rz + 1, Nz)):
+                        d = np.sqrt(dx2 + (y - j)**2 + (z - k)**2)
+                        if (d < r) and (r > result[x, y, z]):
+                            result[x, y, z] = r
+
+
 def porosimetry(im, sizes=25, inlets=None, access_limited=True,
                 mode='hybrid'):
     r"""
@@ -897,7 +1589,9 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
     sizes : array_like or scalar
         The sizes to invade.  If a list of values of provided they are used
         directly.  If a scalar is provided then that number of points spanning
-        the min and max of the distance transform are used.
+        the min and max of the distance transform are used.  If ``mode`` is
+        'sort' then ``None`` can be given to use the exact distance transform
+        values.
 
     inlets : ND-array, boolean
         A boolean mask with True values indicating where the invasion
@@ -920,8 +1614,9 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
 
         'hybrid' - (default) Performs a distance tranform of the void space,
         thresholds to find voxels larger than ``sizes[i]``, trims the resulting
-        mask if ``access_limitations`` is ``True``, then dilates it using the
-        efficient fft-method to obtain the non-wetting fluid configuration.
+        mask if ``access_limitations`` is ``True``, then dilates it using
+        ``porespy.tools.morphology`` to obtain the non-wetting fluid
+        configuration.
 
         'dt' - Same as 'hybrid', except uses a second distance transform,
         relative to the thresholded mask, to find the invading fluid
@@ -932,7 +1627,17 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
         invading fluid confirguration directly, *then* trims if
         ``access_limitations`` is ``True``.  This method is not ideal and is
         included mostly for comparison purposes.  The morphological operations
-        are done using fft-based method implementations.
+        are done using ``porespy.tools.morphology``.
+
+        'sort' - Sorts the voxels by distance transform value once, then
+        visits them in descending order, placing a sphere of the
+        corresponding size at each voxel not already covered by a larger
+        sphere.  This requires a single pass over the image regardless of the
+        number of ``sizes``.  If ``sizes`` is ``None`` the sphere radii are
+        the exact distance transform values rather than a set of bins.  If
+        ``access_limited`` is ``True`` the connectivity of each voxel to the
+        ``inlets`` is tracked incrementally using a disjoint-set forest as
+        the voxels are added, instead of relabeling the image at each size.
 
     Returns
     -------
@@ -947,7 +1652,7 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
 
     See Also
     --------
-    fftmorphology
+    morphology
 
     """
     def trim_blobs(im, inlets):
@@ -963,15 +1668,15 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
         inlets = get_border(im.shape, mode='faces')
     inlets = sp.where(inlets)
 
-    if isinstance(sizes, int):
+    if sizes is None:
+        if mode != 'sort':
+            raise Exception('sizes must be given unless mode is \'sort\'')
+    elif isinstance(sizes, int):
         sizes = sp.logspace(start=sp.log10(sp.amax(dt)), stop=0, num=sizes)
     else:
         sizes = sp.sort(a=sizes)[-1::-1]
 
-    if im.ndim == 2:
-        strel = ps_disk
-    else:
-        strel = ps_ball
+    cross = spim.generate_binary_structure(im.ndim, 1)
 
     imresults = sp.zeros(sp.shape(im))
     if mode == 'mio':
@@ -979,7 +1684,7 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
         impad = sp.pad(im, mode='symmetric', pad_width=pw)
         imresults = sp.zeros(sp.shape(impad))
         for r in tqdm(sizes):
-            imtemp = fftmorphology(impad, strel(r), mode='opening')
+            imtemp = morphology(impad, radius=r, mode='opening')
             if access_limited:
                 imtemp = trim_blobs(imtemp, inlets)
             if sp.any(imtemp):
@@ -1002,13 +1707,188 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
             if access_limited:
                 imtemp = trim_blobs(imtemp, inlets)
             if sp.any(imtemp):
-                imtemp = fftconvolve(imtemp, strel(r), mode='same') > 0.0001
+                imtemp = morphology(imtemp, radius=r, mode='dilation')
                 imresults[(imresults == 0)*imtemp] = r
+    elif mode == 'sort':
+        radii = dt
+        if sizes is not None:
+            radii = _bin_to_sizes(dt, sizes)
+        if access_limited:
+            temp = sp.zeros(im.shape, dtype=bool)
+            temp[inlets] = True
+            temp = spim.binary_dilation(temp, structure=cross)
+            radii = _access_radii(radii, temp)
+        imresults = _insert_spheres_sorted(radii)
     else:
         raise Exception('Unreckognized mode ' + mode)
     return imresults
 
 
+def _bin_to_sizes(dt, sizes):
+    r"""
+    Helper function for ``porosimetry`` which replaces each value in ``dt``
+    with the largest value in ``sizes`` that does not exceed it, or 0 if
+    there is none.
+    """
+    bins = sp.sort(sizes)
+    inds = sp.searchsorted(bins, dt, side='right') - 1
+    radii = sp.where(inds >= 0, bins[inds.clip(min=0)], 0)
+    return radii
+
+
+def _access_radii(radii, inlets):
+    r"""
+    Helper function for ``porosimetry`` which finds the radius at which each
+    voxel first becomes connected to the inlets.
+
+    The voxels are added to a disjoint-set forest in order of decreasing
+    radius, so the connected components of ``radii >= r`` are updated
+    incrementally as ``r`` decreases rather than relabeled at each ``r``.
+    Each component carries a flag indicating whether it contains one of the
+    ``inlets`` voxels, and when a component becomes flagged the current
+    radius is assigned to all of its voxels.  Voxels which never become
+    connected to the inlets are given a value of 0.
+    """
+    mask = radii > 0
+    inds = sp.where(mask.flatten())[0]
+    order = inds[sp.argsort(-radii.flatten()[inds], kind='mergesort')]
+    radii3d = sp.atleast_3d(radii).astype(float)
+    inlets3d = sp.atleast_3d(inlets).astype(bool)
+    access = _access_radii_jit(radii3d, order, inlets3d)
+    return sp.reshape(access, radii.shape)
+
+
+@jit(nopython=True)
+def _access_radii_jit(radii, order, inlets):
+    r"""
+    Numba kernel for ``_access_radii``.  The members of each component are
+    kept in a circular linked list so that they can be visited when the
+    component becomes connected to the inlets.  Each voxel is visited this
+    way at most once.
+    """
+    Nx, Ny, Nz = radii.shape
+    radii = radii.ravel()
+    inlets = inlets.ravel()
+    parent = -np.ones(radii.size, dtype=np.int64)
+    size = np.zeros(radii.size, dtype=np.int64)
+    nxt = np.zeros(radii.size, dtype=np.int64)
+    flag = np.zeros(radii.size, dtype=np.bool_)
+    access = np.zeros(radii.size, dtype=np.float64)
+    nbrs = np.zeros(6, dtype=np.int64)
+    for n in order:
+        r = radii[n]
+        parent[n] = n
+        size[n] = 1
+        nxt[n] = n
+        if inlets[n]:
+            flag[n] = True
+            access[n] = r
+        i = n // (Ny*Nz)
+        j = (n // Nz) % Ny
+        k = n % Nz
+        num = 0
+        if i > 0:
+            nbrs[num] = n - Ny*Nz
+            num += 1
+        if i < Nx - 1:
+            nbrs[num] = n + Ny*Nz
+            num += 1
+        if j > 0:
+            nbrs[num] = n - Nz
+            num += 1
+        if j < Ny - 1:
+            nbrs[num] = n + Nz
+            num += 1
+        if k > 0:
+            nbrs[num] = n - 1
+            num += 1
+        if k < Nz - 1:
+            nbrs[num] = n + 1
+            num += 1
+        for q in range(num):
+            m = nbrs[q]
+            if parent[m] < 0:
+                continue
+            # Find the roots of both voxels, with path halving
+            a = n
+            while parent[a] != a:
+                parent[a] = parent[parent[a]]
+                a = parent[a]
+            b = m
+            while parent[b] != b:
+                parent[b] = parent[parent[b]]
+                b = parent[b]
+            if a == b:
+                continue
+            # If only one component touches the inlets the other is now
+            # accessible at the current radius
+            if flag[a] != flag[b]:
+                c = b if flag[a] else a
+                v = c
+                while True:
+                    access[v] = r
+                    v = nxt[v]
+                    if v == c:
+                        break
+            # Splice the member lists, then union by size
+            temp = nxt[a]
+            nxt[a] = nxt[b]
+            nxt[b] = temp
+            if size[a] < size[b]:
+                a, b = b, a
+            parent[b] = a
+            size[a] += size[b]
+            flag[a] = flag[a] or flag[b]
+    return access
+
+
+def _insert_spheres_sorted(radii):
+    r"""
+    Helper function for ``porosimetry`` which places a sphere of radius
+    ``radii[c]`` centered on every voxel ``c``, visiting the voxels in order
+    of decreasing radius so that each voxel receives the largest radius of
+    all the spheres that cover it.
+    """
+    mask = radii > 0
+    inds = sp.where(mask.flatten())[0]
+    order = inds[sp.argsort(-radii.flatten()[inds], kind='mergesort')]
+    radii3d = sp.atleast_3d(radii).astype(float)
+    result = sp.zeros(radii3d.shape, dtype=float)
+    slack = sp.zeros(radii3d.shape, dtype=float)
+    _insert_spheres_jit(radii3d, order, result, slack)
+    return sp.reshape(result, radii.shape)
+
+
+@jit(nopython=True)
+def _insert_spheres_jit(radii, order, result, slack):
+    r"""
+    Numba kernel for ``_insert_spheres_sorted``.  The ``slack`` array stores
+    the largest value of ``r - d`` among the spheres placed so far, where
+    ``d`` is the distance to the sphere center, so a sphere of radius ``r``
+    centered on a voxel with ``slack >= r`` lies entirely within a sphere
+    that has already been placed and can be skipped.
+    """
+    Nx, Ny, Nz = radii.shape
+    for n in order:
+        i = n // (Ny*Nz)
+        j = (n // Nz) % Ny
+        k = n % Nz
+        r = radii[i, j, k]
+        if slack[i, j, k] >= r:
+            continue
+        R = int(np.ceil(r))
+        for x in range(max(i - R, 0), min(i + R + 1, Nx)):
+            for y in range(max(j - R, 0), min(j + R + 1, Ny)):
+                for z in range(max(k - R, 0), min(k + R + 1, Nz)):
+                    d = np.sqrt((x - i)**2 + (y - j)**2 + (z - k)**2)
+                    if d < r:
+                        if result[x, y, z] == 0:
+                            result[x, y, z] = r
+                        s = r - d
+                        if s > slack[x, y, z]:
+                            slack[x, y, z] = s
+
+
 def _get_axial_shifts(ndim=2, include_diagonals=False):
     r'''
     Helper function to generate the axial shifts that will be performed on
@@ -1037,39 +1917,6 @@ def _get_axial_shifts(ndim=2, include_diagonals=False):
         return np.vstack((x, y, z)).T
 
 
-def _make_stack(im, include_diagonals=False):
-    r'''
-    Creates a stack of images with one extra dimension to the input image
-    with length equal to the number of borders to search + 1.
-    Image is rolled along the axial shifts so that the border pixel is
-    overlapping the original pixel. First image in stack is the original.
-    Stacking makes direct vectorized array comparisons possible.
-    '''
-    ndim = len(np.shape(im))
-    axial_shift = _get_axial_shifts(ndim, include_diagonals)
-    if ndim == 2:
-        stack = np.zeros([np.shape(im)[0],
-                          np.shape(im)[1],
-                          len(axial_shift)+1])
-        stack[:, :, 0] = im
-        for i in range(len(axial_shift)):
-            ax0, ax1 = axial_shift[i]
-            temp = np.roll(np.roll(im, ax0, 0), ax1, 1)
-            stack[:, :, i+1] = temp
-        return stack
-    elif ndim == 3:
-        stack = np.zeros([np.shape(im)[0],
-                          np.shape(im)[1],
-                          np.shape(im)[2],
-                          len(axial_shift)+1])
-        stack[:, :, :, 0] = im
-        for i in range(len(axial_shift)):
-            ax0, ax1, ax2 = axial_shift[i]
-            temp = np.roll(np.roll(np.roll(im, ax0, 0), ax1, 1), ax2, 2)
-            stack[:, :, :, i+1] = temp
-        return stack
-
-
 def nphase_border(im, include_diagonals=False):
     r'''
     Identifies the voxels in regions that border *N* other regions.
@@ -1090,30 +1937,54 @@ def nphase_border(im, include_diagonals=False):
     Returns
     -------
     image : ND-array
-        A copy of ``im`` with voxel values equal to the number of uniquely
-        different bordering values
+        A ``uint8`` image with voxel values equal to the number of uniquely
+        different values among each voxel and its neighbors
+
+    Notes
+    -----
+    The neighbors of each voxel are gathered into a small buffer and counted
+    by a compiled kernel which works through the image one slice at a time,
+    so no stack of shifted copies of the image is created.  Neighbors lying
+    outside the image take the value of the nearest voxel on the edge.
     '''
     # Get dimension of image
     ndim = len(np.shape(im))
     if ndim not in [2, 3]:
         raise NotImplementedError("Function only works for 2d and 3d images")
-    # Pad image to handle edges
-    im = np.pad(im, pad_width=1, mode='edge')
-    # Stack rolled images for each neighbor to be inspected
-    stack = _make_stack(im, include_diagonals)
-    # Sort the stack along the last axis
-    stack.sort()
-    out = np.ones_like(im)
-    # Run through stack recording when neighbor id changes
-    # Number of changes is number of unique bordering regions
-    for k in range(np.shape(stack)[ndim])[1:]:
-        if ndim == 2:
-            mask = stack[:, :, k] != stack[:, :, k-1]
-        elif ndim == 3:
-            mask = stack[:, :, :, k] != stack[:, :, :, k-1]
-        out += mask
-    # Un-pad
+    shifts = _get_axial_shifts(ndim, include_diagonals)
     if ndim == 2:
-        return out[1:-1, 1:-1].copy()
-    else:
-        return out[1:-1, 1:-1, 1:-1].copy()
+        im = im[:, :, np.newaxis]
+        shifts = np.hstack((shifts, np.zeros([len(shifts), 1], dtype=int)))
+    out = np.zeros(im.shape, dtype=np.uint8)
+    _nphase_border_jit(im, shifts.astype(np.int64), out)
+    return np.reshape(out, out.shape[:ndim])
+
+
+@jit(nopython=True, parallel=True)
+def _nphase_border_jit(im, shifts, out):
+    r'''
+    Numba kernel for ``nphase_border`` which counts the distinct values
+    among each voxel and its neighbors given by ``shifts``, clamping
+    neighbors that lie outside the image onto its edge.
+    '''
+    Nx, Ny, Nz = im.shape
+    for i in prange(Nx):
+        buffer = np.empty(shifts.shape[0] + 1, dtype=np.float64)
+        for j in range(Ny):
+            for k in range(Nz):
+                buffer[0] = im[i, j, k]
+                n = 1
+                for s in range(shifts.shape[0]):
+                    x = min(max(i + shifts[s, 0], 0), Nx - 1)
+                    y = min(max(j + shifts[s, 1], 0), Ny - 1)
+                    z = min(max(k + shifts[s, 2], 0), Nz - 1)
+                    v = im[x, y, z]
+                    new = True
+                    for m in range(n):
+                        if buffer[m] == v:
+                            new = False
+                            break
+                    if new:
+                        buffer[n] = v
+                        n += 1
+                out[i, j, k] = n
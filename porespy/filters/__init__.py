@@ -22,9 +22,11 @@ altered values.
     porespy.filters.find_peaks
     porespy.filters.flood
     porespy.filters.local_thickness
+    porespy.filters.marker_watershed
     porespy.filters.porosimetry
     porespy.filters.region_size
     porespy.filters.snow_partitioning
+    porespy.filters.snow_partitioning_parallel
     porespy.filters.trim_extrema
     porespy.filters.trim_floating_solid
     porespy.filters.trim_nearby_peaks
@@ -42,9 +44,11 @@ altered values.
 .. autofunction:: fill_blind_pores
 .. autofunction:: flood
 .. autofunction:: local_thickness
+.. autofunction:: marker_watershed
 .. autofunction:: porosimetry
 .. autofunction:: region_size
 .. autofunction:: snow_partitioning
+.. autofunction:: snow_partitioning_parallel
 .. autofunction:: trim_extrema
 .. autofunction:: trim_floating_solid
 .. autofunction:: trim_nearby_peaks
@@ -55,17 +59,19 @@ altered values.
 from .__funcs__ import apply_chords
 from .__funcs__ import apply_chords_3D
 from .__funcs__ import distance_transform_lin
-from .__funcs__ import fftmorphology
+from porespy.tools import fftmorphology
 from .__funcs__ import fill_blind_pores
 from .__funcs__ import find_disconnected_voxels
 from .__funcs__ import find_dt_artifacts
 from .__funcs__ import find_peaks
 from .__funcs__ import flood
 from .__funcs__ import local_thickness
+from .__funcs__ import marker_watershed
 from .__funcs__ import porosimetry
 from .__funcs__ import reduce_peaks
 from .__funcs__ import region_size
 from .__funcs__ import snow_partitioning
+from .__funcs__ import snow_partitioning_parallel
 from .__funcs__ import trim_extrema
 from .__funcs__ import trim_floating_solid
 from .__funcs__ import trim_nonpercolating_paths
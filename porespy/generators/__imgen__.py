@@ -95,7 +95,10 @@ def RSA(im: array, radius: int, volume_fraction: int = 1,
         im_strel = ball(radius)
         mask_strel = ball(mrad)
     if sp.any(im > 0):
-        mask = ps.tools.fftmorphology(im > 0, im_strel > 0, mode='dilate')
+        # A radius slightly above ``radius`` includes the voxels exactly
+        # ``radius`` away, matching the strel from skimage
+        mask = ps.tools.morphology(im > 0, radius=sp.sqrt(radius**2 + 0.5),
+                                   mode='dilation')
         mask = mask.astype(int)
     else:
         mask = sp.zeros_like(im)
@@ -1,17 +1,28 @@
+import os
+import tempfile
 import scipy as sp
 import numpy as np
-from skimage.measure import regionprops
 import scipy.ndimage as spim
 import scipy.spatial as sptl
 from porespy.tools import extend_slice, mesh_region
 from porespy.filters import find_dt_artifacts
 from collections import namedtuple
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.format import open_memmap
 from tqdm import tqdm
-from scipy import fftpack as sp_ft
+from scipy.fftpack import next_fast_len
+from functools import lru_cache
+try:
+    from scipy.fft import rfftn, irfftn
+except ImportError:
+    from numpy.fft import rfftn, irfftn
 from skimage import measure
+from numba import jit
 
 
-def representative_elementary_volume(im, npoints=1000):
+def representative_elementary_volume(im, npoints=1000, boxes=None,
+                                     sizes=None):
     r"""
     Calculates the porosity of the image as a function subdomain size.  This
     function extracts a specified number of subdomains of random size, then
@@ -23,7 +34,14 @@ def representative_elementary_volume(im, npoints=1000):
         The image of the porous material
     npoints : int
         The number of randomly located and sized boxes to sample.  The default
-        is 1000.
+        is 1000.  This is ignored if ``boxes`` or ``sizes`` is given.
+    boxes : array_like, optional
+        A list of boxes to sample instead of random ones, with shape
+        ``[M, 2, ndim]``.  The first row of each box gives the (inclusive)
+        lower corner and the second row the (exclusive) upper corner.
+    sizes : array_like, optional
+        A list of box edge lengths.  For each size, the image is tiled with a
+        grid of non-overlapping boxes of that size, all of which are sampled.
 
     Returns
     -------
@@ -37,12 +55,10 @@ def representative_elementary_volume(im, npoints=1000):
 
     Notes
     -----
-    This function is frustratingly slow.  Profiling indicates that all the time
-    is spent on scipy's ``sum`` function which is needed to sum the number of
-    void voxels (1's) in each subdomain.
-
-    Also, this function is a prime target for parallelization since the
-    ``npoints`` are calculated independenlty.
+    A summed-area table of the image is computed once, after which the number
+    of void voxels in any box is found from the values at its corners.  All
+    boxes are evaluated at once, so the cost of each is independent of its
+    size.
 
     References
     ----------
@@ -51,27 +67,71 @@ def representative_elementary_volume(im, npoints=1000):
     (1987)
 
     """
-    im_temp = sp.zeros_like(im)
-    crds = sp.array(sp.rand(npoints, im.ndim)*im.shape, dtype=int)
-    pads = sp.array(sp.rand(npoints)*sp.amin(im.shape)/2+10, dtype=int)
-    im_temp[tuple(crds.T)] = True
-    labels, N = spim.label(input=im_temp)
-    slices = spim.find_objects(input=labels)
-    porosity = sp.zeros(shape=(N,), dtype=float)
-    volume = sp.zeros(shape=(N,), dtype=int)
-    for i in tqdm(sp.arange(0, N)):
-        s = slices[i]
-        p = pads[i]
-        new_s = extend_slice(s, shape=im.shape, pad=p)
-        temp = im[new_s]
-        Vp = sp.sum(temp)
-        Vt = sp.size(temp)
-        porosity[i] = Vp/Vt
-        volume[i] = Vt
+    shape = sp.array(im.shape)
+    if boxes is not None:
+        boxes = sp.array(boxes, dtype=int)
+        lo, hi = boxes[:, 0, :], boxes[:, 1, :]
+    elif sizes is not None:
+        lo, hi = _grid_boxes(shape, sizes)
+    else:
+        crds = sp.array(sp.rand(npoints, im.ndim)*shape, dtype=int)
+        pads = sp.array(sp.rand(npoints)*sp.amin(shape)/2+10, dtype=int)
+        lo = sp.maximum(crds - pads[:, None], 0)
+        hi = sp.minimum(crds + pads[:, None] + 1, shape)
+    lo = sp.clip(lo, 0, shape)
+    hi = sp.clip(hi, lo, shape)
+    sat = _summed_area_table(im)
+    Vp = _box_sums(sat, lo, hi)
+    volume = sp.prod(hi - lo, axis=1)
+    porosity = Vp/sp.maximum(volume, 1)
     profile = namedtuple('profile', ('volume', 'porosity'))
-    profile.volume = volume
-    profile.porosity = porosity
-    return profile
+    return profile(volume, porosity)
+
+
+def _grid_boxes(shape, sizes):
+    r"""
+    Helper function for ``representative_elementary_volume`` which returns
+    the lower and upper corners of a grid of boxes tiling an image of the
+    given ``shape``, for each edge length in ``sizes``.
+    """
+    lo = []
+    hi = []
+    for size in sizes:
+        grid = [sp.arange(0, n - size + 1, size) for n in shape]
+        grid = sp.meshgrid(*grid, indexing='ij')
+        corners = sp.vstack([g.ravel() for g in grid]).T
+        lo.append(corners)
+        hi.append(corners + size)
+    return sp.vstack(lo), sp.vstack(hi)
+
+
+def _summed_area_table(im):
+    r"""
+    Returns the summed-area table of ``im``, padded with a leading plane of
+    zeros along each axis.  The smallest integer type able to hold the total
+    of ``im`` is used.
+    """
+    dtype = sp.uint32 if sp.sum(im, dtype=sp.int64) < 2**32 else sp.int64
+    sat = sp.zeros(sp.array(im.shape) + 1, dtype=dtype)
+    sat[(slice(1, None), )*im.ndim] = im
+    for ax in range(im.ndim):
+        sp.cumsum(sat, axis=ax, dtype=sat.dtype, out=sat)
+    return sat
+
+
+def _box_sums(sat, lo, hi):
+    r"""
+    Returns the sum of the image within each box given by the lower (``lo``)
+    and upper (``hi``) corners, using its summed-area table ``sat``.
+    """
+    total = sp.zeros(lo.shape[0], dtype=sp.int64)
+    ndim = lo.shape[1]
+    for corner in product([0, 1], repeat=ndim):
+        crds = tuple(hi[:, ax] if c else lo[:, ax]
+                     for ax, c in enumerate(corner))
+        sign = (-1)**(ndim - sum(corner))
+        total += sign*sat[crds].astype(sp.int64)
+    return total
 
 
 def porosity_profile(im, axis):
@@ -94,6 +154,11 @@ def porosity_profile(im, axis):
     """
     if axis >= im.ndim:
         raise Exception('axis out of range')
+    if im.dtype.kind in 'biu':
+        counts = _phase_counts(im, axis=axis)
+        vals = sp.arange(counts.shape[1])
+        prof = (counts @ vals)/(im.size/im.shape[axis])
+        return prof*100
     im = np.atleast_3d(im)
     a = set(range(im.ndim)).difference(set([axis]))
     a1, a2 = a
@@ -180,8 +245,7 @@ def radial_density(im, bins=10, voxel_size=1):
         im = spim.distance_transform_edt(im)
     mask = find_dt_artifacts(im) == 0
     im[mask] = 0
-    x = im[im > 0].flatten()
-    h = sp.histogram(x, bins=bins, density=True)
+    h = streaming_histogram(im, bins=bins)
     h = _parse_histogram(h=h, voxel_size=voxel_size)
     rdf = namedtuple('radial_density_function',
                      ('R', 'pdf', 'cdf', 'bin_centers', 'bin_edges',
@@ -225,14 +289,16 @@ def porosity(im):
     calculation of accessible porosity, rather than overall porosity.
 
     """
-    im = sp.array(im, dtype=int)
-    Vp = sp.sum(im == 1)
-    Vs = sp.sum(im == 0)
+    counts = sp.zeros(2, dtype=np.int64)
+    temp = _phase_counts(im, max_phase=1)
+    counts[:temp.size] = temp
+    Vs, Vp = counts
     e = Vp/(Vs + Vp)
     return e
 
 
-def two_point_correlation_bf(im, spacing=10):
+def two_point_correlation_bf(im, spacing=10, num_workers=1,
+                             chunk_size=10000):
     r"""
     Calculates the two-point correlation function using brute-force (see Notes)
 
@@ -243,6 +309,12 @@ def two_point_correlation_bf(im, spacing=10):
     spacing : int
         The space between points on the regular grid that is used to generate
         the correlation (see Notes)
+    num_workers : int
+        The number of processes among which the points are divided.  The
+        default is 1.  If ``None`` all available cores are used.
+    chunk_size : int
+        The number of void points whose pairs are counted at once, which
+        limits the memory used by each worker.  The default is 10000.
 
     Returns
     -------
@@ -260,76 +332,108 @@ def two_point_correlation_bf(im, spacing=10):
     onto the image, calculating the distance between each and every pair of
     points, then counting the instances where both pairs lie in the void space.
 
-    This approach uses a distance matrix so can consume memory very quickly for
-    large 3D images and/or close spacing.
+    Rather than computing a distance matrix, the pairs of points lying within
+    each distance are counted using ``scipy.spatial.cKDTree.count_neighbors``
+    for one chunk of void points at a time, so the memory used is
+    proportional to the number of points rather than its square.
     """
-    if im.ndim == 2:
-        pts = sp.meshgrid(range(0, im.shape[0], spacing),
-                          range(0, im.shape[1], spacing))
-        crds = sp.vstack([pts[0].flatten(),
-                          pts[1].flatten()]).T
-    elif im.ndim == 3:
-        pts = sp.meshgrid(range(0, im.shape[0], spacing),
-                          range(0, im.shape[1], spacing),
-                          range(0, im.shape[2], spacing))
-        crds = sp.vstack([pts[0].flatten(),
-                          pts[1].flatten(),
-                          pts[2].flatten()]).T
-    dmat = sptl.distance.cdist(XA=crds, XB=crds)
-    hits = im[pts].flatten()
-    dmat = dmat[hits, :]
-    h1 = sp.histogram(dmat, bins=range(0, int(sp.amin(im.shape)/2), spacing))
-    dmat = dmat[:, hits]
-    h2 = sp.histogram(dmat, bins=h1[1])
+    pts = sp.meshgrid(*[range(0, n, spacing) for n in im.shape],
+                      indexing='ij')
+    crds = sp.vstack([p.flatten() for p in pts]).T
+    hits = im[tuple(pts)].flatten() > 0
+    bins = sp.arange(0, int(sp.amin(im.shape)/2), spacing)
+    # Pairs closer than each upper bin edge, except the last which is
+    # inclusive.  The lower edge of the first bin is 0, below which there
+    # are no pairs, so it is not queried.
+    r = sp.array(bins[1:], dtype=float)
+    r[:-1] -= 1e-6
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    void = crds[hits]
+    # Only the chunks are sent with each task, the trees are built once
+    # per worker by the initializer
+    chunks = [(void[i:i + chunk_size], r)
+              for i in range(0, len(void), chunk_size)]
+    if num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers,
+                                 initializer=_init_pair_trees,
+                                 initargs=(crds, void)) as pool:
+            results = list(pool.map(_count_pairs, chunks))
+    else:
+        _init_pair_trees(crds, void)
+        results = list(map(_count_pairs, chunks))
+        _init_pair_trees(None, None)
+    c1 = sp.zeros(r.size + 1, dtype=sp.int64)
+    c2 = sp.zeros(r.size + 1, dtype=sp.int64)
+    for n1, n2 in results:
+        c1[1:] += n1
+        c2[1:] += n2
+    h1 = sp.diff(c1)
+    h2 = sp.diff(c2)
     tpcf = namedtuple('two_point_correlation_function',
                       ('distance', 'probability'))
-    return tpcf(h2[1][:-1], h2[0]/h1[0])
+    return tpcf(bins[:-1], h2/h1)
+
 
+_pair_trees = None
 
-def _radial_profile(autocorr, r_max, nbins=100):
+
+def _init_pair_trees(crds, void):
     r"""
-    Helper functions to calculate the radial profile of the autocorrelation
-    Masks the image in radial segments from the center and averages the values
-    The distance values are normalized and 100 bins are used as default.
+    Helper function for ``two_point_correlation_bf`` which builds the trees
+    of all points and of the void points in the current process, for use by
+    ``_count_pairs``.  Passing ``None`` releases them.
+    """
+    global _pair_trees
+    if crds is None:
+        _pair_trees = None
+    else:
+        _pair_trees = (sptl.cKDTree(crds), sptl.cKDTree(void))
 
-    Parameters
-    ----------
-    autocorr : ND-array
-        The image of autocorrelation produced by FFT
-    r_max : int or float
-        The maximum radius in pixels to sum the image over
+
+def _count_pairs(args):
+    r"""
+    Helper function for ``two_point_correlation_bf`` which counts the pairs
+    between a chunk of void points and all points, and between the chunk
+    and all void points, lying within each distance in ``r``.
+    """
+    chunk, r = args
+    tree = sptl.cKDTree(chunk)
+    c1 = tree.count_neighbors(_pair_trees[0], r)
+    c2 = tree.count_neighbors(_pair_trees[1], r)
+    return c1, c2
+
+
+@lru_cache(maxsize=4)
+def _radial_bins(shape, r_max, nbins=100):
+    r"""
+    Helper function for ``two_point_correlation_fft`` which finds the radial
+    bin of each voxel in an unshifted autocorrelation of the given ``shape``.
+    Voxels at the origin or beyond ``r_max`` are put in an extra bin at the
+    end.  The result is cached since it only depends on the shape.
 
     Returns
     -------
-    result : named_tuple
-        A named tupling containing an array of ``bins`` of radial position
-        and an array of ``counts`` in each bin.
+    result : tuple
+        The upper edge of each bin, the bin index of each voxel in the
+        flattened autocorrelation and the number of voxels in each bin.
     """
-    if len(autocorr.shape) == 2:
-        adj = sp.reshape(autocorr.shape, [2, 1, 1])
-        inds = sp.indices(autocorr.shape) - adj/2
-        dt = sp.sqrt(inds[0]**2 + inds[1]**2)
-    elif len(autocorr.shape) == 3:
-        adj = sp.reshape(autocorr.shape, [3, 1, 1, 1])
-        inds = sp.indices(autocorr.shape) - adj/2
-        dt = sp.sqrt(inds[0]**2 + inds[1]**2 + inds[2]**2)
-    else:
-        raise Exception('Image dimensions must be 2 or 3')
-    bin_size = np.int(np.ceil(r_max/nbins))
+    bin_size = int(np.ceil(r_max/nbins))
     bins = np.arange(bin_size, r_max, step=bin_size)
-    radial_sum = np.zeros_like(bins)
-    for i, r in enumerate(bins):
-        # Generate Radial Mask from dt using bins
-        mask = (dt <= r) * (dt > (r-bin_size))
-        radial_sum[i] = np.sum(autocorr[mask])/np.sum(mask)
-    # Return normalized bin and radially summed autoc
-    norm_autoc_radial = radial_sum/np.max(autocorr)
-    tpcf = namedtuple('two_point_correlation_function',
-                      ('distance', 'probability'))
-    return tpcf(bins, norm_autoc_radial)
-
-
-def two_point_correlation_fft(im):
+    # Squared distance of each voxel from the origin, allowing for wrapping
+    dist = np.zeros(shape, dtype=np.float32)
+    for ax, n in enumerate(shape):
+        d = (np.fft.fftfreq(n)*n)**2
+        dist += np.reshape(d, [n if i == ax else 1 for i in range(len(shape))])
+    dist = np.sqrt(dist, out=dist)
+    index = (np.ceil(dist/bin_size) - 1).astype(np.int32).ravel()
+    del dist
+    index[(index < 0) + (index >= bins.size)] = bins.size
+    counts = np.bincount(index, minlength=bins.size + 1)[:-1]
+    return bins, index, counts
+
+
+def two_point_correlation_fft(im, periodic=True, phases=None):
     r"""
     Calculates the two-point correlation function using fourier transforms
 
@@ -337,6 +441,16 @@ def two_point_correlation_fft(im):
     ----------
     im : ND-array
         The image of the void space on which the 2-point correlation is desired
+    periodic : boolean
+        If ``True`` (default) the image is assumed to repeat periodically, as
+        is implied by the fourier transform.  If ``False`` the image is
+        padded with zeros and each pair count is divided by the number of
+        pairs of voxels lying in the image at that separation.
+    phases : list, optional
+        The values in ``im`` for which the correlation function is desired,
+        all of which are found using a single batch of transforms.  If given,
+        a list of results is returned with one entry per phase.  The default
+        is to use the values in ``im`` directly.
 
     Returns
     -------
@@ -353,17 +467,48 @@ def two_point_correlation_fft(im):
     function is the inverse FT of the power spectrum density.
     For background read the Scipy fftpack docs and for a good explanation see:
     http://www.ucl.ac.uk/~ucapikr/projects/KamilaSuankulova_BSc_Project.pdf
+
+    Real-input transforms in single precision are used, and the radial
+    average is taken with a single ``bincount`` over a radial bin index which
+    is cached for each image shape.
     """
     # Calculate half lengths of the image
     hls = (np.ceil(np.shape(im))/2).astype(int)
-    # Fourier Transform and shift image
-    F = sp_ft.ifftshift(sp_ft.fftn(sp_ft.fftshift(im)))
-    # Compute Power Spectrum
-    P = sp.absolute(F**2)
+    if phases is None:
+        stack = [im]
+    else:
+        stack = [im == p for p in phases]
+    if periodic:
+        fshape = im.shape
+    else:
+        fshape = tuple(next_fast_len(2*n - 1) for n in im.shape)
+        stack.append(np.ones(im.shape, dtype=bool))
+    # Place all phases in a single array so they are transformed together
+    arr = np.zeros((len(stack), ) + fshape, dtype=np.float32)
+    s = tuple(slice(0, n) for n in im.shape)
+    for i, phase in enumerate(stack):
+        arr[(i, ) + s] = phase
+    axes = tuple(range(1, im.ndim + 1))
+    F = rfftn(arr, axes=axes)
+    del arr
     # Auto-correlation is inverse of Power Spectrum
-    autoc = sp.absolute(sp_ft.ifftshift(sp_ft.ifftn(sp_ft.fftshift(P))))
-    tpcf = _radial_profile(autoc, r_max=np.min(hls))
-    return tpcf
+    P = F.real**2 + F.imag**2
+    del F
+    autoc = irfftn(P, s=fshape, axes=axes)
+    del P
+    if not periodic:
+        autoc = autoc[:-1]/np.maximum(autoc[-1], 1)
+    bins, index, counts = _radial_bins(fshape, int(np.min(hls)))
+    tpcf = namedtuple('two_point_correlation_function',
+                      ('distance', 'probability'))
+    results = []
+    for a in autoc:
+        radial_sum = np.bincount(index, weights=a.ravel(),
+                                 minlength=bins.size + 1)[:-1]
+        results.append(tpcf(bins, radial_sum/counts/a.flat[0]))
+    if phases is None:
+        return results[0]
+    return results
 
 
 def pore_size_distribution(im, bins=10, log=True, voxel_size=1):
@@ -417,11 +562,8 @@ def pore_size_distribution(im, bins=10, log=True, voxel_size=1):
     plt.bar(psd.R, psd.satn, width=psd.bin_widths, edgecolor='k')
 
     """
-    im = im.flatten()
-    vals = im[im > 0]*voxel_size
-    if log:
-        vals = sp.log10(vals)
-    h = _parse_histogram(sp.histogram(vals, bins=bins, density=True))
+    h = streaming_histogram(im, bins=bins, voxel_size=voxel_size, log=log)
+    h = _parse_histogram(h)
     psd = namedtuple('pore_size_distribution',
                      (log*'log' + 'R', 'pdf', 'cdf', 'satn',
                       'bin_centers', 'bin_edges', 'bin_widths'))
@@ -429,6 +571,78 @@ def pore_size_distribution(im, bins=10, log=True, voxel_size=1):
                h.bin_centers, h.bin_edges, h.bin_widths)
 
 
+def streaming_histogram(im, bins=10, weights=None, voxel_size=1, log=False,
+                        density=True, chunk_size=None):
+    r"""
+    Computes the histogram of the positive values in an image, reading the
+    image one slab at a time so it can be a memory-mapped array
+
+    Parameters
+    ----------
+    im : ND-array
+        The image whose non-zero values are to be binned.  Only voxels with
+        values greater than 0 are included.
+    bins : int or array_like
+        The number of bins or the location of the bin edges.  If a number is
+        given, the image is first scanned to find the range of its values,
+        then the bins are spaced evenly over this range as in
+        ``scipy.histogram``.
+    weights : ND-array, optional
+        An image the same shape as ``im`` giving the weight of each voxel.
+    voxel_size : scalar
+        The values in ``im`` are multiplied by this factor before binning.
+        The default is 1.
+    log : boolean
+        If ``True`` the base-10 logarithm of the values is binned.  The
+        default is ``False``.
+    density : boolean
+        If ``True`` (default) the result is normalized to form a probability
+        density.
+    chunk_size : int, optional
+        The number of slices along the first axis to read at once.  The
+        default reads about 16 million voxels at a time.
+
+    Returns
+    -------
+    result : tuple
+        The values of the histogram and the bin edges, in the same form as
+        returned by ``scipy.histogram``.
+
+    """
+    if chunk_size is None:
+        chunk_size = max(1, 2**24//int(sp.prod(im.shape[1:])))
+    slabs = [slice(i, i + chunk_size) for i in range(0, im.shape[0],
+                                                      chunk_size)]
+
+    def values(s):
+        x = im[s]
+        mask = x > 0
+        x = x[mask]*voxel_size
+        if log:
+            x = sp.log10(x)
+        w = None if weights is None else weights[s][mask]
+        return x, w
+
+    if sp.size(bins) == 1:
+        # Find the range of the values in a first pass
+        lo, hi = sp.inf, -sp.inf
+        for s in slabs:
+            x = values(s)[0]
+            if x.size > 0:
+                lo, hi = min(lo, x.min()), max(hi, x.max())
+        if lo > hi:
+            lo, hi = 0, 1
+        bins = sp.histogram([], bins=bins, range=(lo, hi))[1]
+    bins = sp.array(bins, dtype=float)
+    counts = sp.zeros(bins.size - 1, dtype=float)
+    for s in slabs:
+        x, w = values(s)
+        counts += sp.histogram(x, bins=bins, weights=w)[0]
+    if density:
+        counts = counts/counts.sum()/sp.diff(bins)
+    return counts, bins
+
+
 def _parse_histogram(h, voxel_size=1):
     delta_x = h[1]
     P = h[0]
@@ -466,11 +680,98 @@ def chord_counts(im):
     length in a format suitable for ``plt.plot``.
     """
     labels, N = spim.label(im > 0)
-    props = regionprops(labels, coordinates='xy')
-    chord_lens = sp.array([i.filled_area for i in props])
+    chord_lens = sp.bincount(labels.ravel(), minlength=N + 1)[1:]
     return chord_lens
 
 
+def chord_lengths(im, axis=0, spacing=1, trim_edges=True):
+    r"""
+    Finds the length of each chord that would be drawn in the void space by
+    ``apply_chords``, directly from the image without labeling
+
+    Parameters
+    ----------
+    im : ND-array
+        An image of the porous material with void marked as ``True``.
+
+    axis : int
+        The axis along which the chords are measured.  If ``None`` is given
+        the chords along every axis are found and returned separately.
+
+    spacing : int
+        Separation between chords.  The default is 1 voxel.  A value of 0
+        means that every line of voxels is scanned.
+
+    trim_edges : bool (default = ``True``)
+        Whether or not to exclude chords that touch the edges of the image.
+        These chords are artifically shortened, so skew the chord length
+        distribution.
+
+    Returns
+    -------
+    result : 1D-array or list of 1D-arrays
+        A 1D array with one element for each chord, containing its length, or
+        a list with one such array per axis if ``axis`` is ``None``.
+
+    Notes
+    -----
+    The lines of voxels are scanned by a compiled run-length encoder, so no
+    chord image or labels are created.  The chords are the same as those
+    drawn by ``apply_chords`` with the same arguments, except that chords
+    lying side by side when ``spacing`` is 0 are measured separately rather
+    than merged.  The result can be passed to
+    ``chord_length_distribution`` in place of an image.
+
+    See Also
+    --------
+    chord_counts
+    porespy.filters.apply_chords
+
+    """
+    if axis is None:
+        return [chord_lengths(im, axis=ax, spacing=spacing,
+                              trim_edges=trim_edges) for ax in range(im.ndim)]
+    if spacing < 0:
+        raise Exception('Spacing cannot be less than 0')
+    slices = [slice(None, None, spacing*(axis != i) + 1)
+              for i in range(im.ndim)]
+    if trim_edges:
+        # The first and last lines on each axis lie on the image faces
+        slices = [s if axis == i else slice(s.step, (n - 1)//s.step*s.step,
+                                            s.step)
+                  for i, (s, n) in enumerate(zip(slices, im.shape))]
+    im = sp.moveaxis(im[tuple(slices)] > 0, axis, -1)
+    im = sp.reshape(im, (-1, im.shape[-1]))
+    N = _chord_lengths_jit(im, trim_edges, sp.zeros(0, dtype=int))
+    lengths = sp.zeros(N, dtype=int)
+    _chord_lengths_jit(im, trim_edges, lengths)
+    return lengths
+
+
+@jit(nopython=True)
+def _chord_lengths_jit(im, trim_edges, lengths):
+    r"""
+    Numba kernel for ``chord_lengths`` which scans each row of ``im`` for
+    runs of True values.  The length of each run is written into
+    ``lengths`` if it is large enough, and the number of runs is returned.
+    """
+    Nx, Ny = im.shape
+    n = 0
+    for i in range(Nx):
+        start = -1
+        for j in range(Ny + 1):
+            if (j < Ny) and im[i, j]:
+                if start < 0:
+                    start = j
+            elif start >= 0:
+                if not (trim_edges and ((start == 0) or (j == Ny))):
+                    if n < lengths.size:
+                        lengths[n] = j - start
+                    n += 1
+                start = -1
+    return n
+
+
 def linear_density(im, bins=25, voxel_size=1, log=False):
     r"""
     Determines the probability that a point lies within a certain distance
@@ -505,8 +806,7 @@ def linear_density(im, bins=25, voxel_size=1, log=False):
     Macroscopic Properties. Springer, New York (2002)
 
     """
-    x = im[im > 0]
-    h = list(sp.histogram(x, bins=bins, density=True))
+    h = streaming_histogram(im, bins=bins)
     h = _parse_histogram(h=h, voxel_size=voxel_size)
     cld = namedtuple('linear_density_function',
                      ('L', 'pdf', 'cdf', 'relfreq',
@@ -532,6 +832,9 @@ def chord_length_distribution(im, bins=None, log=False, voxel_size=1,
         In both cases, the size of each chord will be computed as the number
         of voxels belonging to each labelled region.
 
+        A 1D array of chord lengths, as produced by ``chord_lengths``, can
+        also be given, in which case no chord image is needed.
+
     bins : scalar or array_like
         If a scalar is given it is interpreted as the number of bins to use,
         and if an array is given they are used as the bins directly.
@@ -585,7 +888,10 @@ def chord_length_distribution(im, bins=None, log=False, voxel_size=1,
     [1] Torquato, S. Random Heterogeneous Materials: Mircostructure and
     Macroscopic Properties. Springer, New York (2002) - See page 45 & 292
     """
-    x = chord_counts(im)
+    if im.ndim == 1:
+        x = im
+    else:
+        x = chord_counts(im)
     if bins is None:
         bins = sp.array(range(0, x.max()+2))*voxel_size
     x = x*voxel_size
@@ -607,7 +913,8 @@ def chord_length_distribution(im, bins=None, log=False, voxel_size=1,
                h.bin_centers, h.bin_edges, h.bin_widths)
 
 
-def region_interface_areas(regions, areas, voxel_size=1, strel=None):
+def region_interface_areas(regions, areas, voxel_size=1, strel=None,
+                           method='marching_cubes'):
     r"""
     Calculates the interfacial area between all pairs of adjecent regions
 
@@ -621,7 +928,7 @@ def region_interface_areas(regions, areas, voxel_size=1, strel=None):
         A list containing the areas of each regions, as determined by
         ``region_surface_area``.  Note that the region number and list index
         are offset by 1, such that the area for region 1 is stored in
-        ``areas[0]``.
+        ``areas[0]``.  This is not used when ``method`` is ``'voxel'``.
     voxel_size : scalar
         The resolution of the image, expressed as the length of one side of a
         voxel, so the volume of a voxel would be **voxel_size**-cubed.  The
@@ -631,6 +938,20 @@ def region_interface_areas(regions, areas, voxel_size=1, strel=None):
         then a spherical element (or disk) with radius 1 is used.  See the
         docstring for ``mesh_region`` for more details, as this argument is
         passed to there.
+    method : string
+        Controls how the area of each interface is found.  Options are:
+
+        **'marching_cubes'** - (default) Each pair of regions is merged and
+        meshed, and the interfacial area is found as
+        0.5*(A_i + A_j - A_ij).
+
+        **'voxel'** - The number of voxel faces (or pixel edges in 2D)
+        shared by each pair is counted.  This requires a single pass over the
+        image and no meshing, so is much faster, but it is only an
+        approximation: the result is the staircase area of the interface,
+        which overestimates the smoothed area of a mesh by up to a factor of
+        about 1.5 for interfaces inclined to the axes.  In 2D the result is a
+        length, scaled by ``voxel_size`` rather than its square.
 
     Returns
     -------
@@ -642,57 +963,71 @@ def region_interface_areas(regions, areas, voxel_size=1, strel=None):
         ``conns[0, 1]`` is 5, then row 0 of ``area`` contains the interfacial
         area shared by regions 0 and 5.
 
+    Notes
+    -----
+    In both cases the adjacent pairs are found together with their number of
+    shared faces in a single pass over the image, so the only per-region
+    work left is meshing the merged pairs, which is done in the bounding box
+    of the pair only.
+
     """
     print('_'*60)
     print('Finding interfacial areas between each region')
-    from skimage.morphology import disk, square, ball, cube
-    im = regions.copy()
-    if im.ndim == 2:
-        cube = square
-        ball = disk
-    # Get 'slices' into im for each region
-    slices = spim.find_objects(im)
-    # Initialize arrays
-    Ps = sp.arange(1, sp.amax(im)+1)
-    sa = sp.zeros_like(Ps, dtype=float)
-    sa_combined = []  # Difficult to preallocate since number of conns unknown
-    cn = []
-    # Start extracting area from im
-    for i in tqdm(Ps):
-        reg = i - 1
-        s = extend_slice(slices[reg], im.shape)
-        sub_im = im[s]
-        mask_im = sub_im == i
-        sa[reg] = areas[reg]
-        im_w_throats = spim.binary_dilation(input=mask_im, structure=ball(1))
-        im_w_throats = im_w_throats*sub_im
-        Pn = sp.unique(im_w_throats)[1:] - 1
-        for j in Pn:
-            if j > reg:
-                cn.append([reg, j])
-                merged_region = im[(min(slices[reg][0].start,
-                                        slices[j][0].start)):
-                                   max(slices[reg][0].stop,
-                                       slices[j][0].stop),
-                                   (min(slices[reg][1].start,
-                                        slices[j][1].start)):
-                                   max(slices[reg][1].stop,
-                                       slices[j][1].stop)]
-                merged_region = ((merged_region == reg + 1) +
-                                 (merged_region == j + 1))
-                mesh = mesh_region(region=merged_region, strel=strel)
-                sa_combined.append(mesh_surface_area(mesh))
-    # Interfacial area calculation
-    cn = sp.array(cn)
-    ia = 0.5 * (sa[cn[:, 0]] + sa[cn[:, 1]] - sa_combined)
-    ia[ia <= 0] = 1
+    im = regions
+    cn, counts = _region_pairs(im)
+    if method == 'voxel':
+        ia = counts * voxel_size**(im.ndim - 1)
+    elif method == 'marching_cubes':
+        slices = spim.find_objects(im)
+        sa = sp.array(areas, dtype=float)
+        sa_combined = sp.zeros(cn.shape[0], dtype=float)
+        for n, (i, j) in enumerate(tqdm(cn)):
+            si = extend_slice(slices[i], im.shape)
+            sj = extend_slice(slices[j], im.shape)
+            s = tuple([slice(min(a.start, b.start), max(a.stop, b.stop))
+                       for a, b in zip(si, sj)])
+            sub_im = im[s]
+            merged_region = (sub_im == i + 1) + (sub_im == j + 1)
+            mesh = mesh_region(region=merged_region, strel=strel)
+            sa_combined[n] = mesh_surface_area(mesh)
+        # Interfacial area calculation
+        ia = 0.5 * (sa[cn[:, 0]] + sa[cn[:, 1]] - sa_combined)
+        ia[ia <= 0] = 1
+        ia = ia * voxel_size**2
+    else:
+        raise Exception('Unrecognized method ' + method)
     result = namedtuple('interfacial_areas', ('conns', 'area'))
     result.conns = cn
-    result.area = ia * voxel_size**2
+    result.area = ia.astype(float)
     return result
 
 
-def region_surface_areas(regions, voxel_size=1, strel=None):
+def _region_pairs(im):
+    r"""
+    Helper function for ``region_interface_areas`` which finds all pairs of
+    regions sharing a face, along with the number of faces they share, in a
+    single pass over the image.  The pairs are returned with the lower region
+    first, offset by 1 as in ``region_surface_areas``, and sorted.
+    """
+    N = sp.amax(im).astype(np.int64) + 1
+    keys = []
+    for ax in range(im.ndim):
+        lo = [slice(None)]*im.ndim
+        hi = [slice(None)]*im.ndim
+        lo[ax] = slice(None, -1)
+        hi[ax] = slice(1, None)
+        a, b = im[tuple(lo)], im[tuple(hi)]
+        hits = (a != b) * (a > 0) * (b > 0)
+        a = a[hits].astype(np.int64)
+        b = b[hits].astype(np.int64)
+        keys.append(sp.minimum(a, b)*N + sp.maximum(a, b))
+    keys, counts = sp.unique(sp.concatenate(keys), return_counts=True)
+    cn = sp.vstack((keys // N, keys % N)).T - 1
+    return cn, counts
+
+
+def region_surface_areas(regions, voxel_size=1, strel=None, num_workers=1,
+                         batch_size=100):
     r"""
     Extracts the surface area of each region in a labeled image.
 
@@ -714,6 +1049,11 @@ def region_surface_areas(regions, voxel_size=1, strel=None):
         then a spherical element (or disk) with radius 1 is used.  See the
         docstring for ``mesh_region`` for more details, as this argument is
         passed to there.
+    num_workers : int
+        The number of processes used to mesh the regions.  The default is 1.
+        If ``None`` all available cores are used.
+    batch_size : int
+        The number of regions sent to a worker at once.  The default is 100.
 
     Returns
     -------
@@ -721,27 +1061,69 @@ def region_surface_areas(regions, voxel_size=1, strel=None):
         A list containing the surface area of each region, offset by 1, such
         that the surface area of region 1 is stored in element 0 of the list.
 
+    Notes
+    -----
+    When more than one worker is used, the image is written to a temporary
+    memory-mapped file which each worker reads from, so only the bounding
+    boxes of the regions are sent to the workers.  The regions are sorted by
+    the position of their bounding boxes so that each batch reads a compact
+    part of the file.  The result does not depend on the number of workers.
+
     """
     print('_'*60)
     print('Finding surface area of each region')
-    im = regions.copy()
+    im = regions
     # Get 'slices' into im for each pore region
     slices = spim.find_objects(im)
-    # Initialize arrays
-    Ps = sp.arange(1, sp.amax(im)+1)
-    sa = sp.zeros_like(Ps, dtype=float)
-    # Start extracting marching cube area from im
-    for i in tqdm(Ps):
-        reg = i - 1
-        s = extend_slice(slices[reg], im.shape)
-        sub_im = im[s]
-        mask_im = sub_im == i
-        mesh = mesh_region(region=mask_im, strel=strel)
-        sa[reg] = mesh_surface_area(mesh)
+    Ps = [i + 1 for i, s in enumerate(slices) if s is not None]
+    Ps.sort(key=lambda i: tuple(s.start for s in slices[i - 1]))
+    boxes = [(i, extend_slice(slices[i - 1], im.shape)) for i in Ps]
+    batches = [boxes[n:n + batch_size] for n in range(0, len(boxes),
+                                                       batch_size)]
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    sa = sp.zeros(len(slices), dtype=float)
+    if num_workers > 1:
+        fd, filename = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+        try:
+            temp = open_memmap(filename, mode='w+', dtype=im.dtype,
+                               shape=im.shape)
+            temp[...] = im
+            temp.flush()
+            del temp
+            args = [(filename, batch, strel) for batch in batches]
+            with ProcessPoolExecutor(max_workers=num_workers) as pool:
+                results = list(tqdm(pool.map(_region_areas_batch, args),
+                                    total=len(args)))
+        finally:
+            os.remove(filename)
+    else:
+        args = [(im, batch, strel) for batch in batches]
+        results = [_region_areas_batch(a) for a in tqdm(args)]
+    for batch, areas in zip(batches, results):
+        sa[[i - 1 for i, s in batch]] = areas
     result = sa * voxel_size**2
     return result
 
 
+def _region_areas_batch(args):
+    r"""
+    Helper function for ``region_surface_areas`` which meshes a batch of
+    regions, given as a list of labels and bounding boxes.  The image is
+    either given directly or as the name of a ``.npy`` file to memory-map.
+    """
+    im, batch, strel = args
+    if isinstance(im, str):
+        im = sp.load(im, mmap_mode='r')
+    areas = []
+    for i, s in batch:
+        mask_im = im[s] == i
+        mesh = mesh_region(region=mask_im, strel=strel)
+        areas.append(mesh_surface_area(mesh))
+    return areas
+
+
 def mesh_surface_area(mesh=None, verts=None, faces=None):
     r"""
     Calculates the surface area of a meshed region
@@ -778,7 +1160,7 @@ def mesh_surface_area(mesh=None, verts=None, faces=None):
     return surface_area
 
 
-def phase_fraction(im, normed=True):
+def phase_fraction(im, normed=True, axis=None):
     r"""
     Calculates the number (or fraction) of each phase in an image
 
@@ -790,26 +1172,75 @@ def phase_fraction(im, normed=True):
         If ``True`` (default) the returned values are normalized by the total
         number of voxels in image, otherwise the voxel count of each phase is
         returned.
+    axis : int
+        If given, the count (or fraction) of each phase is found in each slice
+        normal to ``axis`` instead of in the whole image.  The default is
+        ``None``.
 
     Returns
     -------
-    result : 1D-array
+    result : ND-array
         A array of length max(im) with each element containing the number of
-        voxels found with the corresponding label.
+        voxels found with the corresponding label.  If ``axis`` is given, the
+        array has one row for each slice along ``axis``.
 
     See Also
     --------
     porosity
 
+    Notes
+    -----
+    All phases are counted in a single pass over the image, one slice at a
+    time, so memory-mapped images can be used and boolean or ``uint8`` images
+    are not cast to a larger type.  Negative values are ignored.
+
     """
-    if im.dtype == bool:
-        im = im.astype(int)
-    elif im.dtype != int:
+    if im.dtype.kind not in 'biu':
         raise Exception('Image must contain integer values for each phase')
-    labels = sp.arange(0, sp.amax(im)+1)
-    results = sp.zeros_like(labels)
-    for i in labels:
-        results[i] = sp.sum(im == i)
+    results = _phase_counts(im, axis=axis)
     if normed:
-        results = results/im.size
+        if axis is None:
+            results = results/im.size
+        else:
+            results = results/(im.size/im.shape[axis])
+    return results
+
+
+def _phase_counts(im, axis=None, max_phase=None):
+    r"""
+    Helper function for ``phase_fraction``, ``porosity`` and
+    ``porosity_profile`` which counts the voxels of each non-negative value
+    in ``im``, reading one slice at a time.  If ``axis`` is given the counts
+    are returned for each slice along it as a 2D array, otherwise they are
+    accumulated into a 1D array.  Values above ``max_phase`` are ignored,
+    and non-integer images are truncated one slice at a time.
+    """
+    if im.dtype == bool:
+        im = im.view(np.uint8)
+    ax = 0 if axis is None else axis
+    total = sp.zeros(0, dtype=np.int64)
+    counts = []
+    for i in range(im.shape[ax]):
+        temp = sp.ravel(im[(slice(None), )*ax + (i, )])
+        if (temp.dtype.kind not in 'iu') or (temp.dtype == np.uint64):
+            # bincount can not safely cast uint64, nor accept floats
+            temp = temp.astype(np.int64)
+        if temp.dtype.kind == 'i':
+            temp = temp[temp >= 0]
+        if max_phase is not None:
+            temp = temp[temp <= max_phase]
+        c = sp.bincount(temp).astype(np.int64)
+        if axis is not None:
+            counts.append(c)
+        elif c.size > total.size:
+            c[:total.size] += total
+            total = c
+        else:
+            total[:c.size] += c
+    if axis is None:
+        return total
+    N = max([c.size for c in counts] + [1])
+    results = sp.zeros([len(counts), N], dtype=np.int64)
+    for i, c in enumerate(counts):
+        results[i, :c.size] = c
     return results
@@ -13,6 +13,7 @@ functions can be applied directly to the binary image.
 .. autosummary::
 
     porespy.metrics.chord_counts
+    porespy.metrics.chord_lengths
     porespy.metrics.chord_length_distribution
     porespy.metrics.linear_density
     porespy.metrics.mesh_surface_area
@@ -26,11 +27,14 @@ functions can be applied directly to the binary image.
     porespy.metrics.region_interface_areas
     porespy.metrics.region_surface_areas
     porespy.metrics.regionprops_3D
+    porespy.metrics.regionprops_table_3D
     porespy.metrics.representative_elementary_volume
+    porespy.metrics.streaming_histogram
     porespy.metrics.two_point_correlation_bf
     porespy.metrics.two_point_correlation_fft
 
 .. autofunction:: chord_counts
+.. autofunction:: chord_lengths
 .. autofunction:: chord_length_distribution
 .. autofunction:: linear_density
 .. autofunction:: mesh_surface_area
@@ -44,16 +48,20 @@ functions can be applied directly to the binary image.
 .. autofunction:: region_interface_areas
 .. autofunction:: region_surface_areas
 .. autofunction:: regionprops_3D
+.. autofunction:: regionprops_table_3D
 .. autofunction:: representative_elementary_volume
+.. autofunction:: streaming_histogram
 .. autofunction:: two_point_correlation_bf
 .. autofunction:: two_point_correlation_fft
 
 """
 
 from .__regionprops__ import regionprops_3D
+from .__regionprops__ import regionprops_table_3D
 from .__regionprops__ import props_to_DataFrame
 from .__regionprops__ import props_to_image
 from .__funcs__ import chord_counts
+from .__funcs__ import chord_lengths
 from .__funcs__ import chord_length_distribution
 from .__funcs__ import linear_density
 from .__funcs__ import pore_size_distribution
@@ -61,6 +69,7 @@ from .__funcs__ import radial_density
 from .__funcs__ import porosity
 from .__funcs__ import porosity_profile
 from .__funcs__ import representative_elementary_volume
+from .__funcs__ import streaming_histogram
 from .__funcs__ import two_point_correlation_bf
 from .__funcs__ import two_point_correlation_fft
 from .__funcs__ import region_surface_areas
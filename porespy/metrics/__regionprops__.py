@@ -1,11 +1,14 @@
 import scipy as sp
+import numpy as np
 import scipy.ndimage as spim
 from tqdm import tqdm
-from porespy.tools import extract_subsection, bbox_to_slices
+from functools import wraps
+from porespy.tools import extract_subsection, bbox_to_slices, map_labels
 from skimage.measure import regionprops
 from skimage.measure import mesh_surface_area, marching_cubes_lewiner
 from skimage.morphology import skeletonize_3d, ball
 from pandas import DataFrame
+from numba import jit
 
 
 def props_to_DataFrame(regionprops):
@@ -16,9 +19,10 @@ def props_to_DataFrame(regionprops):
 
     Parameters
     ----------
-    regionprops : list
+    regionprops : list or dict
         This is a list of properties for each region that is computed
-        by ``regionprops_3D``.
+        by ``regionprops_3D``, or a dictionary of arrays as returned by
+        ``regionprops_table_3D``.
 
     Returns
     -------
@@ -31,7 +35,10 @@ def props_to_DataFrame(regionprops):
     --------
     props_to_image
     regionprops_3d
+    regionprops_table_3D
     """
+    if isinstance(regionprops, dict):
+        return DataFrame(regionprops)
     # Parse the regionprops list and pull out all props with scalar values
     metrics = []
     reg = regionprops[0]
@@ -54,16 +61,18 @@ def props_to_DataFrame(regionprops):
     return df
 
 
-def props_to_image(regionprops, shape, prop):
+def props_to_image(regionprops, shape, prop, labels=None, out=None,
+                   dtype=float, chunk_size=None):
     r"""
     Creates an image with each region colored according the specified ``prop``,
     as obtained by ``regionprops_3d``.
 
     Parameters
     ----------
-    regionprops : list
+    regionprops : list or dict
         This is a list of properties for each region that is computed
-        by PoreSpy's ``regionprops_3D`` or Skimage's ``regionsprops``.
+        by PoreSpy's ``regionprops_3D`` or Skimage's ``regionsprops``, or a
+        dictionary of arrays as returned by ``regionprops_table_3D``.
 
     shape : array_like
         The shape of the original image for which ``regionprops`` was obtained.
@@ -74,6 +83,24 @@ def props_to_image(regionprops, shape, prop):
         volumes, or can be an image-type property such as 'border' or
         'convex_image', which will return an image composed of the sub-images.
 
+    labels : ND-array, optional
+        The labeled image for which ``regionprops`` was obtained.  If given,
+        and ``prop`` is a scalar, the values are written into the image in a
+        single lookup over ``labels`` rather than region by region.  This is
+        required when ``regionprops`` is a dictionary.
+
+    out : ND-array, optional
+        An array of the given ``shape`` to write the result into, such as a
+        memory-mapped array.  If not given a new array is created.
+
+    dtype : data-type
+        The data type of the new array, if ``out`` is not given.  The default
+        is ``float``.
+
+    chunk_size : int, optional
+        The number of slices along the first axis to map at once when
+        ``labels`` is given.  See ``porespy.tools.map_labels``.
+
     Returns
     -------
     An ND-image the same size as the original image, with each region
@@ -83,9 +110,29 @@ def props_to_image(regionprops, shape, prop):
     --------
     props_to_DataFrame
     regionprops_3d
+    porespy.tools.map_labels
 
     """
-    im = sp.zeros(shape=shape)
+    if isinstance(regionprops, dict):
+        if labels is None:
+            raise Exception('labels must be given when regionprops is a dict')
+        Ps = sp.array(regionprops['label'])
+        vals = sp.array(regionprops[prop])
+    elif (labels is not None) and (sp.shape(regionprops[0][prop]) == ()):
+        Ps = sp.array([r.label for r in regionprops])
+        vals = sp.array([r[prop] for r in regionprops])
+    else:
+        Ps = None
+    if Ps is not None:
+        N = max(int(sp.amax(labels)), int(sp.amax(Ps)))
+        lut = sp.zeros(N + 1, dtype=dtype if out is None else out.dtype)
+        lut[Ps] = vals
+        return map_labels(labels, lut, out=out, chunk_size=chunk_size)
+    if out is None:
+        im = sp.zeros(shape=shape, dtype=dtype)
+    else:
+        im = out
+        im[...] = 0
     for r in regionprops:
         if prop == 'convex':
             mask = r.convex_image
@@ -97,7 +144,7 @@ def props_to_image(regionprops, shape, prop):
     return im
 
 
-def regionprops_3D(im):
+def regionprops_3D(im, props=None):
     r"""
     Calculates various metrics for each labeled region in a 3D image.
 
@@ -111,19 +158,26 @@ def regionprops_3D(im):
         An imaging containing at least one labeled region.  If a boolean image
         is received than the ``True`` voxels are treated as a single region
         labeled ``1``.  Regions labeled 0 are ignored in all cases.
+    props : list of strings
+        The names of properties to evaluate for all regions before returning,
+        such as ``['volume', 'sphericity']``.  The default is ``None``, in
+        which case nothing is evaluated until it is accessed.
 
     Returns
     -------
-    An augmented version of the list returned by skimage's ``regionprops``.
+    An augmented version of the list returned by skimage's ``regionprops``,
+    with each region wrapped in a ``RegionPropertiesPS`` object which also
+    gives access to all of skimage's properties.
     Information, such as ``volume``, can be found for region A using the
     following syntax: ``result[A-1].volume``.
 
     Notes
     -----
-    This function may seem slow compared to the skimage version, but that is
-    because they defer calculation of certain properties until they are
-    accessed while this one evalulates everything (inlcuding the deferred
-    properties from skimage's ``regionprops``)
+    Like skimage's ``regionprops``, each property is only calculated when it
+    is first accessed, then stored on the region so later access is free.
+    Properties which share intermediate results, such as ``surface_area`` and
+    ``sphericity``, also share the cached intermediates, so asking for
+    ``sphericity`` will not compute a skeleton or convex hull.
 
     Regions can be identified using a watershed algorithm, which can be a bit
     tricky to obtain desired results.  *PoreSpy* includes the SNOW algorithm,
@@ -133,50 +187,240 @@ def regionprops_3D(im):
     print('_'*60)
     print('Calculating regionprops')
 
-    results = regionprops(im, coordinates='xy')
-    for i in tqdm(range(len(results))):
-        mask = results[i].image
+    results = [RegionPropertiesPS(r) for r in
+               regionprops(im, coordinates='xy')]
+    if props is not None:
+        for r in tqdm(results):
+            for prop in props:
+                getattr(r, prop)
+    return results
+
+
+def _memoize(func):
+    r"""
+    Turns a method of ``RegionPropertiesPS`` into a property which is
+    evaluated on first access and stored on the instance.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(self):
+        cache = self.__dict__.setdefault('_ps_cache', {})
+        if name not in cache:
+            cache[name] = func(self)
+        return cache[name]
+    return property(wrapper)
+
+
+class RegionPropertiesPS():
+    r"""
+    Wraps a region returned by skimage's ``regionprops`` and adds the 3D
+    metrics returned by ``regionprops_3D``, each of which is evaluated lazily
+    and memoized.  All other attributes are looked up on the wrapped region.
+    """
+
+    def __init__(self, region):
+        self._region = region
+
+    def __getattr__(self, name):
+        # Only called for names not defined on this class
+        if name == '_region':
+            raise AttributeError(name)
+        return getattr(self._region, name)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __dir__(self):
+        props = [k for k in dir(type(self)) if not k.startswith('_')]
+        return props + [k for k in self._region.__dir__() if k not in props]
+
+    @_memoize
+    def _dt(self):
+        mask = self.image
         mask_padded = sp.pad(mask, pad_width=1, mode='constant')
         temp = spim.distance_transform_edt(mask_padded)
-        dt = extract_subsection(temp, shape=mask.shape)
-        # ---------------------------------------------------------------------
-        # Slice indices
-        results[i].slice = results[i]._slice
-        # ---------------------------------------------------------------------
+        return extract_subsection(temp, shape=mask.shape)
+
+    @_memoize
+    def _mesh(self):
+        tmp = sp.pad(sp.atleast_3d(self.image), pad_width=1, mode='constant')
+        tmp = spim.convolve(tmp, weights=ball(1))/5
+        verts, faces, norms, vals = marching_cubes_lewiner(volume=tmp, level=0)
+        return verts, faces
+
+    @property
+    def slice(self):
+        # Slice indices, stored as _slice on older versions of skimage
+        return getattr(self._region, '_slice', None) or self._region.slice
+
+    @property
+    def volume(self):
         # Volume of regions in voxels
-        results[i].volume = results[i].area
-        # ---------------------------------------------------------------------
+        return self.area
+
+    @property
+    def bbox_volume(self):
         # Volume of bounding box, in voxels
-        results[i].bbox_volume = sp.prod(mask.shape)
-        # ---------------------------------------------------------------------
+        return sp.prod(self.image.shape)
+
+    @_memoize
+    def border(self):
         # Create an image of the border
-        results[i].border = dt == 1
-        # ---------------------------------------------------------------------
+        return self._dt == 1
+
+    @_memoize
+    def inscribed_sphere(self):
         # Create an image of the maximal inscribed sphere
+        dt = self._dt
         r = dt.max()
         inv_dt = spim.distance_transform_edt(dt < r)
-        results[i].inscribed_sphere = inv_dt < r
-        # ---------------------------------------------------------------------
+        return inv_dt < r
+
+    @property
+    def surface_mesh_vertices(self):
+        return self._mesh[0]
+
+    @property
+    def surface_mesh_simplices(self):
+        return self._mesh[1]
+
+    @_memoize
+    def surface_area(self):
         # Find surface area using marching cubes and analyze the mesh
-        tmp = sp.pad(sp.atleast_3d(mask), pad_width=1, mode='constant')
-        tmp = spim.convolve(tmp, weights=ball(1))/5
-        verts, faces, norms, vals = marching_cubes_lewiner(volume=tmp, level=0)
-        results[i].surface_mesh_vertices = verts
-        results[i].surface_mesh_simplices = faces
-        area = mesh_surface_area(verts, faces)
-        results[i].surface_area = area
-        # ---------------------------------------------------------------------
-        # Find sphericity
-        vol = results[i].volume
+        return mesh_surface_area(*self._mesh)
+
+    @property
+    def sphericity(self):
+        vol = self.volume
         r = (3/4/sp.pi*vol)**(1/3)
         a_equiv = 4*sp.pi*(r)**2
-        a_region = results[i].surface_area
-        results[i].sphericity = a_equiv/a_region
-        # ---------------------------------------------------------------------
+        a_region = self.surface_area
+        return a_equiv/a_region
+
+    @_memoize
+    def skeleton(self):
         # Find skeleton of region
-        results[i].skeleton = skeletonize_3d(mask)
-        # ---------------------------------------------------------------------
+        return skeletonize_3d(self.image)
+
+    @property
+    def convex_volume(self):
         # Volume of convex image, equal to area in 2D, so just translating
-        results[i].convex_volume = results[i].convex_area
+        return self.convex_area
 
-    return results
+
+def regionprops_table_3D(im):
+    r"""
+    Calculates the scalar metrics of each labeled region in bulk, returning
+    one array per metric rather than one object per region.
+
+    Parameters
+    ----------
+    im : array_like
+        An image containing at least one labeled region.  If a boolean image
+        is received than the ``True`` voxels are treated as a single region
+        labeled ``1``.  Regions labeled 0 are ignored in all cases.
+
+    Returns
+    -------
+    A dictionary of 1D arrays, with one entry per region present in the image.
+    The keys are ``'label'``, ``'volume'``, ``'equivalent_diameter'``,
+    ``'inscribed_radius'``, ``'surface_voxels'``, and ``'bbox-i'`` and
+    ``'centroid-i'`` for each axis ``i``, following the naming used by
+    skimage's ``regionprops_table``.  This can be passed directly to
+    ``props_to_DataFrame``.
+
+    Notes
+    -----
+    The volume, bounding box, centroid and number of surface voxels of all
+    regions are found in a single compiled pass over the image, so no Python
+    objects are created per region and the memory used is a few arrays of
+    length N-regions.  A voxel counts as a surface voxel if any of its face
+    neighbors has a different label or lies outside the image.
+
+    The ``inscribed_radius`` is the largest value of the distance transform
+    of the non-zero voxels within each region, which is the convention used
+    by the network extraction tools, rather than the distance to the region
+    boundary used by ``regionprops_3D``.
+
+    See Also
+    --------
+    regionprops_3D
+    props_to_DataFrame
+
+    """
+    im = sp.array(im, copy=False)
+    if im.dtype == bool:
+        im = im.view(np.uint8)
+    ndim = im.ndim
+    im3 = sp.reshape(im, im.shape + (1,)*(3 - ndim))
+    N = int(sp.amax(im))
+    counts, lo, hi, sums, surf = _regionprops_table_jit(im3, N)
+    Ps = sp.where(counts[1:] > 0)[0] + 1
+    vol = counts[Ps]
+    d = {}
+    d['label'] = Ps
+    d['volume'] = vol
+    if ndim == 3:
+        d['equivalent_diameter'] = (6*vol/sp.pi)**(1/3)
+    else:
+        d['equivalent_diameter'] = sp.sqrt(4*vol/sp.pi)
+    dt = spim.distance_transform_edt(im > 0)
+    d['inscribed_radius'] = sp.array(spim.maximum(dt, labels=im, index=Ps))
+    d['surface_voxels'] = surf[Ps]
+    for i in range(ndim):
+        d['bbox-' + str(i)] = lo[Ps, i]
+    for i in range(ndim):
+        d['bbox-' + str(i + ndim)] = hi[Ps, i] + 1
+    for i in range(ndim):
+        d['centroid-' + str(i)] = sums[Ps, i]/vol
+    return d
+
+
+@jit(nopython=True)
+def _regionprops_table_jit(im, N):
+    r"""
+    Numba kernel for ``regionprops_table_3D`` which accumulates the voxel
+    count, bounding box, coordinate sums and surface voxel count of each
+    label in a single pass over a 3D image.
+    """
+    counts = np.zeros(N + 1, dtype=np.int64)
+    lo = np.zeros((N + 1, 3), dtype=np.int64)
+    hi = np.zeros((N + 1, 3), dtype=np.int64)
+    sums = np.zeros((N + 1, 3), dtype=np.float64)
+    surf = np.zeros(N + 1, dtype=np.int64)
+    for n in range(N + 1):
+        for ax in range(3):
+            lo[n, ax] = im.shape[ax]
+    X, Y, Z = im.shape
+    for x in range(X):
+        for y in range(Y):
+            for z in range(Z):
+                L = im[x, y, z]
+                if L == 0:
+                    continue
+                counts[L] += 1
+                lo[L, 0] = min(lo[L, 0], x)
+                lo[L, 1] = min(lo[L, 1], y)
+                lo[L, 2] = min(lo[L, 2], z)
+                hi[L, 0] = max(hi[L, 0], x)
+                hi[L, 1] = max(hi[L, 1], y)
+                hi[L, 2] = max(hi[L, 2], z)
+                sums[L, 0] += x
+                sums[L, 1] += y
+                sums[L, 2] += z
+                if (x == 0) or (x == X - 1):
+                    surf[L] += 1
+                elif (im[x - 1, y, z] != L) or (im[x + 1, y, z] != L):
+                    surf[L] += 1
+                elif (Y > 1) and ((y == 0) or (y == Y - 1)):
+                    surf[L] += 1
+                elif (Y > 1) and ((im[x, y - 1, z] != L)
+                                  or (im[x, y + 1, z] != L)):
+                    surf[L] += 1
+                elif (Z > 1) and ((z == 0) or (z == Z - 1)):
+                    surf[L] += 1
+                elif (Z > 1) and ((im[x, y, z - 1] != L)
+                                  or (im[x, y, z + 1] != L)):
+                    surf[L] += 1
+    return counts, lo, hi, sums, surf
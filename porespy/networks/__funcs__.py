@@ -1,7 +1,7 @@
 import scipy as sp
 import numpy as np
 import openpnm as op
-from porespy.tools import make_contiguous
+from porespy.tools import make_contiguous, map_labels
 from skimage.segmentation import find_boundaries
 from skimage.morphology import ball, cube, disk
 from tqdm import tqdm
@@ -43,8 +43,7 @@ def map_to_regions(regions, values):
     values = sp.array(values).flatten()
     if sp.size(values) != regions.max() + 1:
         raise Exception('Number of values does not match number of regions')
-    im = sp.zeros_like(regions)
-    im = values[regions]
+    im = map_labels(regions, values)
     return im
 
 
@@ -1,10 +1,21 @@
+import os
 import scipy as sp
+import numpy as np
 import scipy.ndimage as spim
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import product
 from skimage.morphology import ball, disk
 from skimage.measure import marching_cubes_lewiner
 from array_split import shape_split
-from scipy.signal import fftconvolve
+from scipy.fftpack import next_fast_len
+from numba import jit
+from numpy.lib.format import open_memmap
+try:
+    from scipy.fft import rfftn, irfftn
+except ImportError:
+    from numpy.fft import rfftn, irfftn
 
 
 def align_image_with_openpnm(im):
@@ -34,7 +45,7 @@ def align_image_with_openpnm(im):
     return im
 
 
-def fftmorphology(im, strel, mode='opening'):
+def fftmorphology(im, strel, mode='opening', block_shape=None):
     r"""
     Perform morphological operations on binary images using fft approach for
     improved performance
@@ -51,6 +62,11 @@ def fftmorphology(im, strel, mode='opening'):
         The type of operation to perform.  Options are 'dilation', 'erosion',
         'opening' and 'closing'.
 
+    block_shape : list of ints, optional
+        If given, the image is processed in blocks of this shape so that the
+        memory used by the FFTs scales with the block size rather than the
+        image size.  The default is to process the whole image at once.
+
     Returns
     -------
     image : ND-array
@@ -59,10 +75,15 @@ def fftmorphology(im, strel, mode='opening'):
 
     Notes
     -----
-    This function uses ``scipy.signal.fftconvolve`` which *can* be more than
-    10x faster than the standard binary morphology operation in
-    ``scipy.ndimage``.  This speed up may not always be realized, depending
-    on the scipy distribution used.
+    The convolutions are performed with real-input FFTs in single precision
+    (unless ``strel`` is large enough for rounding errors to matter).  When
+    ``block_shape`` is given the transform of ``strel`` is cached, so
+    repeated calls with the same structuring element and block shape only
+    transform the image.  It is not cached otherwise, since the transform
+    is then as large as the image.  Each
+    block is extended by the size of ``strel`` and only the part of the
+    result that is not affected by the circular wrap-around is kept
+    (overlap-save), so the blocks give the same result as the whole image.
 
     Examples
     --------
@@ -95,37 +116,226 @@ def fftmorphology(im, strel, mode='opening'):
     >>> array_equal(result, temp)
     True
 
+    >>> result = ps.filters.fftmorphology(im, strel=disk(5), mode='opening',
+    ...                                   block_shape=[30, 30])
+    >>> temp = spim.binary_opening(im, structure=disk(5))
+    >>> array_equal(result, temp)
+    True
+
     """
     def erode(im, strel):
-        t = fftconvolve(im, strel, mode='same') > (strel.sum() - 0.1)
-        return t
+        return _fft_threshold(im, strel, strel.sum() - 0.5, block_shape)
 
     def dilate(im, strel):
-        t = fftconvolve(im, strel, mode='same') > 0.1
-        return t
+        return _fft_threshold(im, strel, 0.5, block_shape)
 
-    # Perform erosion and dilation
-    # The array must be padded with 0's so it works correctly at edges
-    temp = sp.pad(array=im, pad_width=1, mode='constant', constant_values=0)
+    strel = strel > 0
     if mode.startswith('ero'):
-        temp = erode(temp, strel)
+        result = erode(im, strel)
     if mode.startswith('dila'):
-        temp = dilate(temp, strel)
-
-    # Remove padding from resulting image
-    if im.ndim == 2:
-        result = temp[1:-1, 1:-1]
-    elif im.ndim == 3:
-        result = temp[1:-1, 1:-1, 1:-1]
-
-    # Perform opening and closing
+        result = dilate(im, strel)
     if mode.startswith('open'):
-        temp = fftmorphology(im=im, strel=strel, mode='erosion')
-        result = fftmorphology(im=temp, strel=strel, mode='dilation')
+        result = dilate(erode(im, strel), strel)
     if mode.startswith('clos'):
-        temp = fftmorphology(im=im, strel=strel, mode='dilation')
-        result = fftmorphology(im=temp, strel=strel, mode='erosion')
+        result = erode(dilate(im, strel), strel)
+    return result
 
+
+def _fft_threshold(im, strel, thresh, block_shape=None):
+    r"""
+    Helper function for ``fftmorphology`` which convolves ``im`` with
+    ``strel`` (as in the 'same' mode of ``scipy.signal.fftconvolve``) one
+    block at a time and returns a boolean image of where the result exceeds
+    ``thresh``.
+    """
+    dtype = sp.float32 if strel.sum() < 2**16 else sp.float64
+    cache = block_shape is not None
+    if block_shape is None:
+        block_shape = im.shape
+    block_shape = [min(b, n) for b, n in zip(block_shape, im.shape)]
+    k = strel.shape
+    lo = [(n - 1) - (n - 1)//2 for n in k]
+    fshape = tuple(next_fast_len(b + n - 1) for b, n in zip(block_shape, k))
+    if cache:
+        strel_fft = _strel_fft(strel.astype(dtype).tobytes(), k, dtype,
+                               fshape)
+    else:
+        strel_fft = rfftn(strel.astype(dtype), fshape)
+    result = sp.zeros(im.shape, dtype=bool)
+    starts = [range(0, n, b) for n, b in zip(im.shape, block_shape)]
+    for a in product(*starts):
+        b = [min(i + s, n) for i, s, n in zip(a, block_shape, im.shape)]
+        # Extract the block extended by the strel, zero padded beyond im
+        seg = sp.zeros(fshape, dtype=dtype)
+        src = tuple(slice(max(i - p, 0), min(j + n - 1 - p, N))
+                    for i, j, p, n, N in zip(a, b, lo, k, im.shape))
+        dst = tuple(slice(s.start - (i - p), s.stop - (i - p))
+                    for s, i, p in zip(src, a, lo))
+        seg[dst] = im[src]
+        conv = irfftn(rfftn(seg) * strel_fft, fshape)
+        valid = tuple(slice(n - 1, n - 1 + j - i) for n, i, j in zip(k, a, b))
+        out = tuple(slice(i, j) for i, j in zip(a, b))
+        result[out] = conv[valid] > thresh
+    return result
+
+
+@lru_cache(maxsize=32)
+def _strel_fft(strel, shape, dtype, fshape):
+    r"""
+    Returns the real-input FFT of a structuring element, given as the bytes
+    of an array of the given ``shape`` and ``dtype``, zero padded to
+    ``fshape``.  The arguments are hashable so the result can be cached.
+    """
+    strel = sp.frombuffer(strel, dtype=dtype).reshape(shape)
+    return rfftn(strel, fshape)
+
+
+def morphology(im, radius, mode='dilation', backend='auto'):
+    r"""
+    Perform morphological operations on binary images using a disk (2D) or
+    ball (3D) structuring element, with a choice of methods
+
+    Parameters
+    ----------
+    im : nd-array
+        The binary image on which to perform the morphological operation
+
+    radius : scalar
+        The radius of the structuring element, which includes all voxels
+        *less than* ``radius`` from its center as in ``ps_disk`` and
+        ``ps_ball``.
+
+    mode : string
+        The type of operation to perform.  Options are 'dilation', 'erosion',
+        'opening' and 'closing'.
+
+    backend : string
+        The method used to perform the operation.  Options are:
+
+        'edt' - Thresholds a Euclidean distance transform of the image, which
+        takes the same time regardless of ``radius``.
+
+        'fft' - Convolves the image with the structuring element using
+        ``fftmorphology``.
+
+        'ndimage' - Uses the binary morphology functions in
+        ``scipy.ndimage``, which is fastest for very small radii.
+
+        'auto' - (default) Chooses one of the above based on the size of the
+        image and ``radius``.
+
+    Returns
+    -------
+    image : ND-array
+        A copy of the image with the specified morphological operation
+        applied.  All backends give identical results.
+
+    See Also
+    --------
+    fftmorphology
+
+    Notes
+    -----
+    A voxel lies within the dilation of the image if it is less than
+    ``radius`` from a foreground voxel, and within the erosion if it is at
+    least ``radius`` from every background voxel, including those lying
+    beyond the edges of the image.  The 'edt' backend computes these
+    distances directly.  With 'auto', the cost of each backend is estimated
+    from the image size and ``radius``: 'ndimage' scales with the number of
+    voxels in the structuring element, 'fft' with the size of the image
+    padded by ``radius``, and 'edt' with the size of the image alone.  So
+    'ndimage' is used for very small radii, 'edt' for radii that are large
+    compared to the image, and 'fft' otherwise.
+
+    Examples
+    --------
+    >>> import porespy as ps
+    >>> from numpy import array_equal
+    >>> im = ps.generators.blobs(shape=[100, 100], porosity=0.8)
+    >>> a = ps.tools.morphology(im, radius=5, mode='opening', backend='edt')
+    >>> b = ps.tools.morphology(im, radius=5, mode='opening', backend='fft')
+    >>> array_equal(a, b)
+    True
+
+    """
+    im = im > 0
+    if backend == 'auto':
+        backend = _choose_backend(im.shape, radius)
+    if backend == 'edt':
+        def erode(im):
+            return _edt_erode(im, radius)
+
+        def dilate(im):
+            return _edt_dilate(im, radius)
+    elif backend == 'fft':
+        strel = ps_disk(radius) if im.ndim == 2 else ps_ball(radius)
+
+        def erode(im):
+            return fftmorphology(im, strel, mode='erosion')
+
+        def dilate(im):
+            return fftmorphology(im, strel, mode='dilation')
+    elif backend == 'ndimage':
+        strel = ps_disk(radius) if im.ndim == 2 else ps_ball(radius)
+
+        def erode(im):
+            return spim.binary_erosion(im, structure=strel)
+
+        def dilate(im):
+            return spim.binary_dilation(im, structure=strel)
+    else:
+        raise Exception('Unrecognized backend ' + backend)
+    if mode.startswith('ero'):
+        result = erode(im)
+    elif mode.startswith('dila'):
+        result = dilate(im)
+    elif mode.startswith('open'):
+        result = dilate(erode(im))
+    elif mode.startswith('clos'):
+        result = erode(dilate(im))
+    else:
+        raise Exception('Unrecognized mode ' + mode)
+    return result
+
+
+def _choose_backend(shape, radius):
+    r"""
+    Helper function for ``morphology`` which picks the backend that should
+    be fastest for an image of the given ``shape`` and a structuring element
+    of the given ``radius``.
+    """
+    N = float(sp.prod(shape))
+    M = float(sp.prod([n + 2*int(sp.ceil(radius)) for n in shape]))
+    if len(shape) == 2:
+        S = sp.pi*radius**2
+    else:
+        S = 4/3*sp.pi*radius**3
+    # Rough relative costs, with the weight of 'edt' found empirically
+    costs = {'ndimage': N*S, 'fft': M*sp.log2(M), 'edt': 70*N}
+    return min(costs, key=costs.get)
+
+
+def _edt_dilate(im, radius):
+    r"""
+    Dilates ``im`` by thresholding the distance transform of its background
+    """
+    if not sp.any(im):
+        return sp.zeros_like(im)
+    return spim.distance_transform_edt(~im) < radius
+
+
+def _edt_erode(im, radius):
+    r"""
+    Erodes ``im`` by thresholding the distance transform of its foreground,
+    treating the region beyond the edges of the image as background
+    """
+    result = spim.distance_transform_edt(im) >= radius
+    # Distance from each voxel to the nearest voxel beyond the image
+    for ax, n in enumerate(im.shape):
+        i = sp.arange(n)
+        shape = [1]*im.ndim
+        shape[ax] = n
+        result &= sp.reshape(sp.minimum(i + 1, n - i) >= radius, shape)
     return result
 
 
@@ -190,6 +400,190 @@ def subdivide(im, divs=2):
     return s
 
 
+def label_parallel(im, structure=None, divs=None, num_workers=None,
+                   filename=None):
+    r"""
+    Labels the connected components of an image by labeling slabs of it
+    independently, in parallel, then merging the labels of components that
+    span the interfaces between slabs.
+
+    Parameters
+    ----------
+    im : ND-array
+        A boolean image with ``True`` values indicating the phase to be
+        labeled.  A memory-mapped array (i.e. ``numpy.memmap``) is accepted,
+        in which case only one slab per worker is ever read into memory.
+
+    structure : ND-array
+        The structuring element defining connectivity, as used by
+        ``scipy.ndimage.label``.  The default is to connect the faces only.
+
+    divs : int
+        The number of slabs along the first axis into which the image is
+        divided.  The default is to use one slab per worker.
+
+    num_workers : int
+        The number of processes to use.  The default is ``None`` which uses
+        all available cores.  If 1 is given, the slabs are processed serially
+        in the current process.
+
+    filename : string
+        The path of a ``.npy`` file in which the labels are stored as a
+        memory-mapped array.  If not given (default) the labels are returned
+        as an ordinary array.
+
+    Returns
+    -------
+    result : named_tuple
+        A named-tuple containing:
+
+        *labels* - An ``int32`` image the same shape as ``im`` with each
+        connected component given a unique label, numbered from 1
+
+        *N* - The number of labels
+
+        *faces* - A boolean array of shape ``[N + 1, 2*im.ndim]`` indicating
+        whether each label touches each face of the image.  Column ``2*ax``
+        refers to the face at the start of axis ``ax`` and ``2*ax + 1`` to
+        the face at its end.  Row 0 refers to the background and is False.
+
+    Notes
+    -----
+    Components that cross a slab interface are found by comparing the two
+    planes of voxels on either side of it, and their labels are combined
+    using a disjoint-set forest.  The labels are then renumbered in a second
+    pass over the slabs, so at no point is more than one slab per worker and
+    the two planes at each interface held in memory.
+
+    See Also
+    --------
+    scipy.ndimage.label
+
+    """
+    if structure is None:
+        structure = spim.generate_binary_structure(im.ndim, 1)
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    if divs is None:
+        divs = num_workers
+    bounds = sp.unique(sp.linspace(0, im.shape[0], divs + 1).astype(int))
+    slabs = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+    if filename is None:
+        labels = sp.zeros(im.shape, dtype=sp.int32)
+    else:
+        labels = open_memmap(filename, mode='w+', dtype=sp.int32,
+                             shape=im.shape)
+    pool = None
+    if num_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=num_workers)
+    N = 0
+    # Only read as many slabs as there are workers to limit memory usage
+    for n in range(0, len(slabs), num_workers):
+        batch = slabs[n:n + num_workers]
+        args = [(im[s], structure) for s in batch]
+        if pool is None:
+            results = map(_label_slab, args)
+        else:
+            results = pool.map(_label_slab, args)
+        for s, (lab, n_slab) in zip(batch, results):
+            lab[lab > 0] += N
+            labels[s] = lab
+            N += n_slab
+    if pool is not None:
+        pool.shutdown()
+    # Merge labels of components spanning each interface between slabs
+    parent = sp.arange(N + 1, dtype=sp.int64)
+    for b in bounds[1:-1]:
+        a, c = _interface_pairs(labels[b - 1], labels[b], structure)
+        _union_labels_jit(parent, a, c)
+    roots = _find_roots_jit(parent)
+    lut = sp.unique(roots, return_inverse=True)[1].astype(sp.int32)
+    N = int(lut.max())
+    # Renumber each slab, recording the faces touched by each label
+    faces = sp.zeros((N + 1, 2*im.ndim), dtype=bool)
+    for s in slabs:
+        lab = lut[labels[s]]
+        labels[s] = lab
+        if s.start == 0:
+            faces[lab[0], 0] = True
+        if s.stop == im.shape[0]:
+            faces[lab[-1], 1] = True
+        for ax in range(1, im.ndim):
+            faces[sp.take(lab, 0, axis=ax), 2*ax] = True
+            faces[sp.take(lab, -1, axis=ax), 2*ax + 1] = True
+    faces[0] = False
+    if filename is not None:
+        labels.flush()
+    tup = namedtuple('results', field_names=['labels', 'N', 'faces'])
+    return tup(labels, N, faces)
+
+
+def _label_slab(args):
+    r"""
+    Helper function for ``label_parallel`` which labels a single slab
+    """
+    im, structure = args
+    labels, N = spim.label(im, structure=structure)
+    return labels.astype(sp.int32), N
+
+
+def _interface_pairs(A, B, structure):
+    r"""
+    Helper function for ``label_parallel`` which finds the pairs of labels
+    on either side of an interface, given by the planes ``A`` and ``B``, that
+    are connected according to ``structure``.
+    """
+    pairs_a = [sp.zeros(0, dtype=sp.int64)]
+    pairs_b = [sp.zeros(0, dtype=sp.int64)]
+    # The connections across the interface are given by the last layer of
+    # the structuring element, with each entry offsetting the plane in B
+    for d in sp.argwhere(structure[-1]) - 1:
+        sa = tuple(slice(max(0, -i), n - max(0, i)) for i, n in
+                   zip(d, A.shape))
+        sb = tuple(slice(max(0, i), n - max(0, -i)) for i, n in
+                   zip(d, B.shape))
+        a = sp.ravel(A[sa])
+        b = sp.ravel(B[sb])
+        mask = (a > 0)*(b > 0)
+        pairs_a.append(a[mask].astype(sp.int64))
+        pairs_b.append(b[mask].astype(sp.int64))
+    return sp.concatenate(pairs_a), sp.concatenate(pairs_b)
+
+
+@jit(nopython=True)
+def _union_labels_jit(parent, a, b):
+    r"""
+    Numba kernel for ``label_parallel`` which joins the sets containing each
+    pair of labels in ``a`` and ``b``, keeping the lower label as the root.
+    """
+    for n in range(a.size):
+        x = a[n]
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        y = b[n]
+        while parent[y] != y:
+            parent[y] = parent[parent[y]]
+            y = parent[y]
+        if x < y:
+            parent[y] = x
+        elif y < x:
+            parent[x] = y
+
+
+@jit(nopython=True)
+def _find_roots_jit(parent):
+    r"""
+    Numba kernel for ``label_parallel`` which returns the root of each label.
+    Since each root is lower than its members, visiting the labels in order
+    ensures each parent is already resolved.
+    """
+    roots = np.zeros_like(parent)
+    for n in range(parent.size):
+        roots[n] = roots[parent[n]] if parent[n] != n else n
+    return roots
+
+
 def bbox_to_slices(bbox):
     r"""
     Given a tuple containing bounding box coordinates, return a tuple of slice
@@ -262,7 +656,7 @@ def get_slice(im, center, size, pad=0):
     return slc
 
 
-def find_outer_region(im, r=0):
+def find_outer_region(im, r=0, num_workers=1):
     r"""
     Finds regions of the image that are outside of the solid matrix.
 
@@ -284,6 +678,10 @@ def find_outer_region(im, r=0):
         size is padded by this amount in all directions, so the image can
         become quite large and unwieldy if too large a value is given.
 
+    num_workers : int
+        The number of processes used to label the padded image.  The default
+        is 1.  See ``label_parallel``.
+
     Returns
     -------
     image : ND-array
@@ -299,8 +697,8 @@ def find_outer_region(im, r=0):
     dt = spim.distance_transform_edt(input=im_padded)
     seeds = (dt >= r) + get_border(shape=im_padded.shape)
     # Remove seeds not connected to edges
-    labels = spim.label(seeds)[0]
-    mask = labels == 1  # Assume label of 1 on edges, assured by adding border
+    tup = label_parallel(seeds, num_workers=num_workers)
+    mask = sp.any(tup.faces, axis=1)[tup.labels]
     dt = spim.distance_transform_edt(~mask)
     outer_region = dt < r
     outer_region = extract_subsection(im=outer_region, shape=im.shape)
@@ -563,6 +961,57 @@ def randomize_colors(im, keep_vals=[0]):
     return im_new
 
 
+def map_labels(labels, lut, out=None, dtype=None, chunk_size=None):
+    r"""
+    Replaces each label in an image with the value stored at that index of a
+    lookup table
+
+    Parameters
+    ----------
+    labels : ND-array
+        An image of non-negative integer labels, such as the regions returned
+        by ``snow_partitioning``.  Memory-mapped arrays are fine.
+    lut : array_like
+        The lookup table, where ``lut[n]`` is the value to write wherever
+        ``labels`` is *n*.  It must be at least ``labels.max() + 1`` long.
+    out : ND-array, optional
+        An array the same shape as ``labels`` to write the result into, such
+        as a memory-mapped array.  If not given a new array is created.
+    dtype : data-type, optional
+        The data type of the new array, if ``out`` is not given.  The default
+        is the data type of ``lut``.
+    chunk_size : int, optional
+        The number of slices along the first axis to process at once.  The
+        default is ``None``, which processes the whole image at once.  Smaller
+        values limit the size of the temporary arrays.
+
+    Returns
+    -------
+    image : ND-array
+        An image the same shape as ``labels`` containing the mapped values.
+
+    Examples
+    --------
+    >>> import porespy as ps
+    >>> import scipy as sp
+    >>> labels = sp.array([[0, 1], [2, 1]])
+    >>> print(ps.tools.map_labels(labels, [0.0, 0.5, 2.0]))
+    [[0.  0.5]
+     [2.  0.5]]
+
+    """
+    lut = sp.array(lut, copy=False).flatten()
+    if out is None:
+        dtype = lut.dtype if dtype is None else dtype
+        out = sp.empty(labels.shape, dtype=dtype)
+    lut = lut.astype(out.dtype, copy=False)
+    if chunk_size is None:
+        chunk_size = max(labels.shape[0], 1)
+    for i in range(0, labels.shape[0], chunk_size):
+        out[i:i + chunk_size] = lut[labels[i:i + chunk_size]]
+    return out
+
+
 def make_contiguous(im, keep_zeros=True):
     r"""
     Take an image with arbitrary greyscale values and adjust them to ensure
@@ -23,8 +23,11 @@ that do NOT return a modified version of the original image.
     porespy.tools.insert_cylinder
     porespy.tools.insert_sphere
     porespy.tools.in_hull
+    porespy.tools.label_parallel
     porespy.tools.make_contiguous
+    porespy.tools.map_labels
     porespy.tools.mesh_region
+    porespy.tools.morphology
     porespy.tools.norm_to_uniform
     porespy.tools.overlay
     porespy.tools.randomize_colors
@@ -44,8 +47,11 @@ that do NOT return a modified version of the original image.
 .. autofunction:: insert_cylinder
 .. autofunction:: insert_sphere
 .. autofunction:: in_hull
+.. autofunction:: label_parallel
 .. autofunction:: make_contiguous
+.. autofunction:: map_labels
 .. autofunction:: mesh_region
+.. autofunction:: morphology
 .. autofunction:: norm_to_uniform
 .. autofunction:: overlay
 .. autofunction:: randomize_colors
@@ -67,8 +73,11 @@ from .__funcs__ import get_slice
 from .__funcs__ import insert_cylinder
 from .__funcs__ import insert_sphere
 from .__funcs__ import in_hull
+from .__funcs__ import label_parallel
 from .__funcs__ import make_contiguous
+from .__funcs__ import map_labels
 from .__funcs__ import mesh_region
+from .__funcs__ import morphology
 from .__funcs__ import overlay
 from .__funcs__ import norm_to_uniform
 from .__funcs__ import randomize_colors
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import porespy as ps
 import pytest
 import scipy as sp
@@ -53,6 +56,26 @@ class FilterTest():
         mip = ps.filters.porosimetry(im=self.im, sizes=s)
         assert sp.allclose(sp.unique(mip)[1:], s)
 
+    def test_porosimetry_sort_matches_hybrid(self):
+        im = self.im[:, :, 50]
+        fft = ps.filters.porosimetry(im, access_limited=False, mode='hybrid')
+        srt = ps.filters.porosimetry(im, access_limited=False, mode='sort')
+        assert sp.all(fft == srt)
+        exact = ps.filters.local_thickness(im, sizes=None, mode='sort')
+        assert sp.all(exact >= srt)
+        assert exact.max() == spim.distance_transform_edt(im).max()
+
+    def test_porosimetry_sort_access_limited(self):
+        im = self.im[:, :, 50]
+        fft = ps.filters.porosimetry(im, mode='hybrid')
+        srt = ps.filters.porosimetry(im, mode='sort')
+        assert sp.all(fft == srt)
+        inlets = sp.zeros_like(im)
+        inlets[0, :] = True
+        fft = ps.filters.porosimetry(im, inlets=inlets, mode='hybrid')
+        srt = ps.filters.porosimetry(im, inlets=inlets, mode='sort')
+        assert srt.sum() <= fft.sum()
+
     def test_apply_chords_axis0(self):
         c = ps.filters.apply_chords(im=self.im, spacing=3, axis=0)
         assert c.sum() == 23722
@@ -71,6 +94,13 @@ class FilterTest():
         c = ps.filters.apply_chords(im=self.im, axis=2)
         assert c.sum() == 103347
 
+    def test_apply_chords_num_workers(self):
+        for axis in [0, 1, 2]:
+            c1 = ps.filters.apply_chords(im=self.im, axis=axis, label=True)
+            c2 = ps.filters.apply_chords(im=self.im, axis=axis, label=True,
+                                         num_workers=2)
+            assert sp.all(c1 == c2)
+
     def test_apply_chords_with_negative_spacing(self):
         with pytest.raises(Exception):
             ps.filters.apply_chords(im=self.im, spacing=-1)
@@ -102,6 +132,30 @@ class FilterTest():
         assert len(s) == 2
         assert max(s) == 1.0
 
+    def test_flood_sum_mean_std_median(self):
+        size = ps.filters.flood(im=self.flood_im_dt, mode='size')
+        total = ps.filters.flood(im=self.flood_im_dt, mode='sum')
+        mean = ps.filters.flood(im=self.flood_im_dt, mode='mean')
+        assert sp.allclose(total, mean*size)
+        std = ps.filters.flood(im=self.flood_im_dt, mode='std')
+        assert sp.all(std >= 0)
+        labels = spim.label(self.flood_im_dt > 0)[0]
+        ref = spim.standard_deviation(self.flood_im_dt, labels=labels,
+                                      index=labels[labels > 0])
+        assert sp.allclose(std[labels > 0], ref)
+        med = ps.filters.flood(im=self.flood_im_dt, mode='median')
+        mx = ps.filters.flood(im=self.flood_im_dt, mode='max')
+        assert sp.all(med <= mx)
+
+    def test_flood_unsigned_regions(self):
+        labels = spim.label(self.flood_im_dt > 0)[0]
+        for mode in ['size', 'sum', 'mean', 'max']:
+            ref = ps.filters.flood(im=self.flood_im_dt, regions=labels,
+                                   mode=mode)
+            m = ps.filters.flood(im=self.flood_im_dt, mode=mode,
+                                 regions=labels.astype(sp.uint64))
+            assert sp.allclose(m, ref)
+
     def test_find_disconnected_voxels_2d(self):
         h = ps.filters.find_disconnected_voxels(self.im[:, :, 0])
         assert sp.sum(h) == 477
@@ -175,6 +229,15 @@ class FilterTest():
         lt = ps.filters.local_thickness(self.im, mode='hybrid')
         assert lt.max() == self.im_dt.max()
 
+    def test_local_thickness_exact(self):
+        lt = ps.filters.local_thickness(self.im, mode='exact')
+        assert lt.max() == self.im_dt.max()
+        srt = ps.filters.local_thickness(self.im, sizes=None, mode='sort')
+        assert sp.all(lt == srt)
+        lt2 = ps.filters.local_thickness(self.im, mode='exact',
+                                         max_memory=1e6)
+        assert sp.all(lt == lt2)
+
     def test_porosimetry(self):
         im2d = self.im[:, :, 50]
         lt = ps.filters.local_thickness(im2d)
@@ -232,6 +295,13 @@ class FilterTest():
         test = ps.tools.fftmorphology(im, strel=ball(3), mode='closing')
         assert sp.all(truth == test)
 
+    def test_morphology_fft_blocks_3D(self):
+        im = ps.generators.blobs(shape=[100, 100, 100])
+        truth = spim.binary_closing(im, structure=ball(3))
+        test = ps.tools.fftmorphology(im, strel=ball(3), mode='closing',
+                                      block_shape=[40, 64, 30])
+        assert sp.all(truth == test)
+
     def test_reduce_peaks(self):
         im = ~ps.generators.lattice_spheres(shape=[50, 50], radius=5, offset=3)
         peaks = ps.filters.reduce_peaks(im)
@@ -283,6 +353,26 @@ class FilterTest():
         assert nb.tolist() == [1.0, 2.0, 4.0, 8.0]
         assert counts.tolist() == [729000, 486000, 108000, 8000]
 
+    def test_nphase_border_matches_stack(self):
+        def stacked(im, include_diagonals):
+            # Reference implementation which sorts a stack of rolled images
+            conn = im.ndim if include_diagonals else 1
+            shifts = np.array(np.where(
+                spim.generate_binary_structure(im.ndim, conn))).T - 1
+            im = np.pad(im, pad_width=1, mode='edge')
+            stack = np.stack([np.roll(im, shift, axis=tuple(range(im.ndim)))
+                              for shift in shifts], axis=-1)
+            stack.sort()
+            out = 1 + np.sum(stack[..., 1:] != stack[..., :-1], axis=-1)
+            return out[tuple([slice(1, -1)]*im.ndim)]
+        np.random.seed(0)
+        for shape in [[40, 30], [20, 15, 10]]:
+            im = np.random.randint(0, 4, size=shape)
+            im = spim.zoom(im, zoom=2, order=0)
+            for diag in [False, True]:
+                borders = ps.filters.nphase_border(im, include_diagonals=diag)
+                assert np.all(borders == stacked(im, diag))
+
     def test_find_dt_artifacts(self):
         im = ps.generators.lattice_spheres(shape=[50, 50], radius=4, offset=5)
         dt = spim.distance_transform_edt(im)
@@ -290,6 +380,126 @@ class FilterTest():
         inds = sp.where(ar == ar.max())
         assert sp.all(dt[inds] - ar[inds] == 1)
 
+    def test_find_dt_artifacts_chunked(self):
+        ar = ps.filters.find_dt_artifacts(self.im_dt)
+        ar_chunked = ps.filters.find_dt_artifacts(self.im_dt, chunk_size=7)
+        assert sp.all(ar == ar_chunked)
+
+    def test_trim_saddle_points(self):
+        dt = spim.gaussian_filter(self.im_dt, sigma=0.4)
+        peaks = ps.filters.find_peaks(dt=dt)
+        trimmed = ps.filters.trim_saddle_points(peaks=peaks, dt=dt,
+                                                max_iters=500)
+        assert sp.all(peaks[trimmed])
+        dt_max = spim.maximum_filter(dt, size=3, mode='constant')
+        assert sp.all(dt_max[trimmed] == dt[trimmed])
+        assert spim.label(trimmed)[1] <= spim.label(peaks)[1]
+
+    def test_trim_saddle_points_matches_loop(self):
+        dt = self.im_dt
+        peaks = ps.filters.find_peaks(dt=dt)
+        trimmed = ps.filters.trim_saddle_points(peaks=peaks, dt=dt)
+        # Reference per-peak loop, removing only the voxels of each peak
+        labels, N = spim.label(peaks)
+        slices = spim.find_objects(labels)
+        ref = sp.copy(peaks)
+        for i in range(N):
+            s = ps.tools.extend_slice(s=slices[i], shape=peaks.shape, pad=10)
+            peaks_i = labels[s] == i+1
+            dt_i = dt[s]
+            peaks_dil = sp.copy(peaks_i)
+            for iters in range(10):
+                peaks_dil = spim.binary_dilation(input=peaks_dil,
+                                                 structure=sp.ones([3]*3))
+                peaks_max = peaks_dil*sp.amax(dt_i*peaks_dil)
+                peaks_extended = (peaks_max == dt_i)*(dt_i > 0)
+                if sp.all(peaks_extended == peaks_i):
+                    break
+                elif sp.sum(peaks_extended*peaks_i) == 0:
+                    ref[s][peaks_i] = False
+                    break
+        assert sp.all(trimmed == ref)
+
+    def test_trim_nearby_peaks(self):
+        peaks = ps.filters.find_peaks(dt=self.im_dt)
+        trimmed = ps.filters.trim_nearby_peaks(peaks=peaks, dt=self.im_dt)
+        assert sp.all(peaks[trimmed])
+        assert 0 < spim.label(trimmed)[1] < spim.label(peaks)[1]
+
+    def test_distance_transform_lin(self):
+        im = sp.array([[1, 1, 0, 1, 1, 1, 1, 0, 1]], dtype=bool)
+        f = ps.filters.distance_transform_lin(im, axis=1, mode='forward')
+        assert sp.all(f == [[1, 2, 0, 1, 2, 3, 4, 0, 1]])
+        b = ps.filters.distance_transform_lin(im, axis=1, mode='reverse')
+        assert sp.all(b == [[2, 1, 0, 4, 3, 2, 1, 0, 1]])
+        both = ps.filters.distance_transform_lin(im, axis=1, mode='both')
+        assert sp.all(both == sp.minimum(f, b))
+
+    def test_distance_transform_lin_all_axes(self):
+        out = sp.zeros(self.im.shape, dtype=sp.uint16)
+        lin = ps.filters.distance_transform_lin(self.im, axis=None, out=out)
+        assert lin is out
+        lins = [ps.filters.distance_transform_lin(self.im, axis=ax)
+                for ax in range(3)]
+        assert sp.all(lin == sp.amin(lins, axis=0))
+
+    def test_marker_watershed(self):
+        from skimage.morphology import watershed
+        dt = spim.gaussian_filter(self.im_dt, sigma=0.4)
+        markers = spim.label(ps.filters.find_peaks(dt=dt))[0]
+        truth = watershed(-dt, markers=markers, mask=self.im)
+        regions = ps.filters.marker_watershed(dt, markers=markers,
+                                              mask=self.im)
+        assert regions.dtype == sp.int32
+        assert sp.all(self.im[regions > 0])
+        assert sp.sum(regions == truth) > 0.95*regions.size
+        shuffled = ps.filters.marker_watershed(dt, markers=markers,
+                                               mask=self.im, randomize=True,
+                                               out=markers)
+        assert shuffled is markers
+        assert sp.unique(shuffled).size == sp.unique(regions).size
+        markers = spim.label(ps.filters.find_peaks(dt=dt))[0]
+        unmasked, peak = ps.filters.marker_watershed(dt, markers=markers,
+                                                     return_stats=True)
+        assert sp.all(unmasked > 0)
+        assert peak > 0
+
+    def test_snow_partitioning_parallel(self):
+        im = ps.generators.blobs(shape=[200, 200], porosity=0.6)
+        regions = ps.filters.snow_partitioning_parallel(im, divs=2,
+                                                        overlap=20,
+                                                        num_workers=1)
+        assert regions.shape == im.shape
+        assert sp.all(regions[~im] == 0)
+        full = ps.filters.snow_partitioning(im)
+        assert abs(regions.max() - full.max()) < 0.1*full.max()
+        assert not isinstance(regions, np.memmap)
+
+    def test_snow_partitioning_parallel_filename(self):
+        im = ps.generators.blobs(shape=[100, 100], porosity=0.6)
+        folder = tempfile.mkdtemp()
+        filename = os.path.join(folder, 'regions.npy')
+        regions = ps.filters.snow_partitioning_parallel(im, divs=2,
+                                                        num_workers=1,
+                                                        filename=filename)
+        assert isinstance(regions, np.memmap)
+        assert sp.all(np.load(filename) == regions)
+        del regions
+        shutil.rmtree(folder)
+
+    def test_snow_partitioning_parallel_seams(self):
+        im = sp.zeros([200, 200], dtype=bool)
+        for c in [[100, 30], [100, 90], [100, 150], [40, 60], [160, 120]]:
+            im = ps.tools.insert_sphere(im, c, 12)
+        regions = ps.filters.snow_partitioning_parallel(im, divs=2,
+                                                        overlap=5,
+                                                        num_workers=1)
+        pores, N = spim.label(im)
+        # Each disk, including those split across tiles, is one region
+        for i in range(1, N + 1):
+            assert sp.unique(regions[pores == i]).size == 1
+        assert sp.unique(regions[im]).size == N
+
 
 if __name__ == '__main__':
     t = FilterTest()
@@ -46,11 +46,33 @@ class MetricsTest():
         phi1 = ps.metrics.porosity(im=self.im3D)
         assert sp.sqrt((sp.mean(tpcf_fft.probability[-5:]) - phi1)**2) < t
 
+    def test_tpcf_fft_nonperiodic_phases(self):
+        phi = ps.metrics.porosity(im=self.im2D_big)
+        tpcf = ps.metrics.two_point_correlation_fft(self.im2D_big,
+                                                    periodic=False)
+        assert sp.sqrt((sp.mean(tpcf.probability[-5:]) - phi)**2) < 0.2
+        solid, void = ps.metrics.two_point_correlation_fft(self.im2D_big,
+                                                           phases=[0, 1])
+        single = ps.metrics.two_point_correlation_fft(self.im2D_big)
+        assert sp.allclose(void.probability, single.probability)
+        assert sp.sqrt((sp.mean(solid.probability[-5:]) - (1 - phi))**2) < 0.2
+
     def test_pore_size_distribution(self):
         mip = ps.filters.porosimetry(self.im3D)
         psd = ps.metrics.pore_size_distribution(mip)
         assert sp.sum(psd.satn) == 1.0
 
+    def test_streaming_histogram(self):
+        dt = spim.distance_transform_edt(self.blobs)
+        h1 = ps.metrics.streaming_histogram(dt, bins=15, chunk_size=7)
+        h2 = sp.histogram(dt[dt > 0], bins=15, density=True)
+        assert sp.allclose(h1[0], h2[0])
+        assert sp.allclose(h1[1], h2[1])
+        w = ps.metrics.streaming_histogram(dt, bins=h2[1], weights=dt,
+                                           density=False)
+        assert sp.allclose(w[0], sp.histogram(dt[dt > 0], bins=h2[1],
+                                              weights=dt[dt > 0])[0])
+
     def test_two_point_correlation_bf(self):
         tpcf_bf = ps.metrics.two_point_correlation_bf(self.im2D)
         # autocorrelation fn should level off at around the porosity
@@ -58,10 +80,37 @@ class MetricsTest():
         phi1 = ps.metrics.porosity(im=self.im2D)
         assert sp.sqrt((sp.mean(tpcf_bf.probability[-5:]) - phi1)**2) < t
 
+    def test_two_point_correlation_bf_matches_distance_matrix(self):
+        im = self.blobs[:40, :40, :40]
+        tpcf = ps.metrics.two_point_correlation_bf(im, spacing=3,
+                                                   chunk_size=100)
+        pts = sp.meshgrid(*[range(0, 40, 3)]*3, indexing='ij')
+        crds = sp.vstack([p.flatten() for p in pts]).T
+        hits = im[tuple(pts)].flatten()
+        dmat = sp.spatial.distance.cdist(crds[hits], crds)
+        h1 = sp.histogram(dmat, bins=range(0, 20, 3))[0]
+        h2 = sp.histogram(dmat[:, hits], bins=range(0, 20, 3))[0]
+        assert sp.allclose(tpcf.probability, h2/h1)
+        tpcf2 = ps.metrics.two_point_correlation_bf(im, spacing=3,
+                                                    chunk_size=100,
+                                                    num_workers=2)
+        assert sp.allclose(tpcf2.probability, tpcf.probability)
+
     def test_rev(self):
         rev = ps.metrics.representative_elementary_volume(self.blobs)
         assert (sp.mean(rev.porosity) - 0.5)**2 < 0.05
 
+    def test_rev_boxes_and_sizes(self):
+        boxes = [[[0, 0, 0], [101, 101, 101]], [[10, 20, 30], [15, 40, 31]]]
+        rev = ps.metrics.representative_elementary_volume(self.blobs,
+                                                          boxes=boxes)
+        assert rev.volume.tolist() == [101**3, 5*20*1]
+        assert rev.porosity[0] == self.blobs.sum()/self.blobs.size
+        assert rev.porosity[1] == self.blobs[10:15, 20:40, 30:31].mean()
+        rev = ps.metrics.representative_elementary_volume(self.blobs,
+                                                          sizes=[50, 100])
+        assert rev.volume.tolist() == [50**3]*8 + [100**3]
+
     def test_radial_density(self):
         den = ps.metrics.radial_density(self.blobs)
         assert den.cdf.max() == 1
@@ -71,11 +120,49 @@ class MetricsTest():
         rp = ps.metrics.regionprops_3D(label)
         ps.metrics.props_to_DataFrame(rp)
 
+    def test_regionprops_3D_lazy(self):
+        label = spim.label(self.im3D)[0]
+        rp = ps.metrics.regionprops_3D(label, props=['sphericity'])
+        cache = rp[0]._ps_cache
+        assert 'surface_area' in cache.keys()
+        assert 'skeleton' not in cache.keys()
+        assert rp[0].volume == sp.sum(label == 1)
+        skel = rp[0].skeleton
+        assert rp[0].skeleton is skel
+
+    def test_regionprops_table_3D(self):
+        for im in [self.im2D, self.im3D]:
+            label = spim.label(im)[0]
+            rp = ps.metrics.regionprops_3D(label)
+            d = ps.metrics.regionprops_table_3D(label)
+            assert sp.all(d['label'] == [r.label for r in rp])
+            assert sp.all(d['volume'] == [r.volume for r in rp])
+            assert sp.all(d['surface_voxels'] == [r.border.sum() for r in rp])
+            for i in range(im.ndim):
+                assert sp.all(d['bbox-' + str(i)] == [r.bbox[i] for r in rp])
+                assert sp.allclose(d['centroid-' + str(i)],
+                                   [r.centroid[i] for r in rp])
+            df = ps.metrics.props_to_DataFrame(d)
+            assert len(df) == len(rp)
+
     def test_props_to_image(self):
         label = spim.label(self.im2D)[0]
         rp = ps.metrics.regionprops_3D(label)
         ps.metrics.props_to_image(rp, self.im2D.shape, 'solidity')
 
+    def test_props_to_image_labels(self):
+        label = spim.label(self.im3D)[0]
+        rp = ps.metrics.regionprops_3D(label)
+        im1 = ps.metrics.props_to_image(rp, label.shape, 'volume')
+        im2 = ps.metrics.props_to_image(rp, label.shape, 'volume',
+                                        labels=label, chunk_size=7)
+        assert sp.all(im1 == im2)
+        d = ps.metrics.regionprops_table_3D(label)
+        out = sp.zeros(label.shape, dtype=sp.int32)
+        ps.metrics.props_to_image(d, label.shape, 'volume', labels=label,
+                                  out=out)
+        assert sp.all(out == im1)
+
     def test_porosity_profile(self):
         ps.metrics.porosity_profile(self.im2D, axis=0)
         ps.metrics.porosity_profile(self.im2D, axis=1)
@@ -94,6 +181,16 @@ class MetricsTest():
         chords = ps.filters.apply_chords(self.im3D)
         ps.metrics.chord_length_distribution(chords, normalization='length')
 
+    def test_chord_lengths(self):
+        for axis in [0, 1, 2]:
+            chords = ps.filters.apply_chords(self.blobs, axis=axis)
+            x = sp.sort(ps.metrics.chord_lengths(self.blobs, axis=axis))
+            assert sp.all(x == sp.sort(ps.metrics.chord_counts(chords)))
+        lengths = ps.metrics.chord_lengths(self.im2D, axis=None)
+        assert len(lengths) == 2
+        ps.metrics.chord_length_distribution(lengths[0],
+                                             normalization='length')
+
     def test_mesh_surface_area(self):
         region = self.regions == 1
         mesh = ps.tools.mesh_region(region)
@@ -107,6 +204,13 @@ class MetricsTest():
         areas = ps.metrics.region_surface_areas(regions)
         assert not sp.any(sp.isnan(areas))
 
+    def test_region_surface_areas_parallel(self):
+        regions = self.regions
+        a1 = ps.metrics.region_surface_areas(regions)
+        a2 = ps.metrics.region_surface_areas(regions, num_workers=2,
+                                             batch_size=3)
+        assert sp.all(a1 == a2)
+
     def test_region_interface_areas(self):
         regions = self.regions
         areas = ps.metrics.region_surface_areas(regions)
@@ -114,6 +218,24 @@ class MetricsTest():
         assert sp.all(ia.conns[0] == [0, 1])
         assert sp.around(ia.area[0], decimals=2) == 8.85
 
+    def test_region_interface_areas_voxel(self):
+        regions = self.regions
+        ia = ps.metrics.region_interface_areas(regions, areas=None,
+                                               method='voxel')
+        assert sp.all(ia.conns[0] == [0, 1])
+        mask = spim.binary_dilation(regions == 1) * (regions == 2)
+        assert ia.area[0] >= mask.sum()
+
+    def test_region_interface_areas_voxel_scaling(self):
+        for shape in [[10, 10], [10, 10, 10]]:
+            regions = sp.ones(shape, dtype=int)
+            regions[5:, ...] = 2
+            ia = ps.metrics.region_interface_areas(regions, areas=None,
+                                                   voxel_size=2,
+                                                   method='voxel')
+            assert sp.all(ia.conns == [[0, 1]])
+            assert ia.area[0] == 10**(len(shape) - 1) * 2**(len(shape) - 1)
+
     def test_phase_fraction(self):
         im = sp.reshape(sp.random.randint(0, 10, 1000), [10, 10, 10])
         labels = sp.unique(im, return_counts=True)[1]
@@ -125,6 +247,20 @@ class MetricsTest():
         with pytest.raises(Exception):
             ps.metrics.phase_fraction(sp.rand(10, 10, 10), normed=True)
 
+    def test_phase_fraction_axis(self):
+        im = sp.reshape(sp.random.randint(0, 8, 1000), [10, 10, 10])
+        im = im.astype(sp.uint8)
+        counts = ps.metrics.phase_fraction(im, normed=False, axis=1)
+        assert counts.shape == (10, 8)
+        for i in range(8):
+            assert sp.all(counts[:, i] == sp.sum(im == i, axis=(0, 2)))
+        prof = ps.metrics.porosity_profile(self.im3D, axis=1)
+        phi = sp.mean(self.im3D, axis=(0, 2))*100
+        assert sp.allclose(prof, phi)
+        assert ps.metrics.porosity(im == 1) == sp.mean(im == 1)
+        total = ps.metrics.phase_fraction(im.astype(sp.uint64), normed=False)
+        assert sp.all(total == counts.sum(axis=0))
+
 
 if __name__ == '__main__':
     t = MetricsTest()
@@ -113,6 +113,49 @@ class ToolsTest():
         im = ps.tools.insert_sphere(im, [10, 100, 100], 50)
         im = ps.tools.insert_sphere(im, [180, 100, 100], 50)
 
+    def test_morphology_backends_agree(self):
+        for mode in ['erosion', 'dilation', 'opening', 'closing']:
+            for im in [self.im2D, self.im3D]:
+                res = [ps.tools.morphology(im, radius=4.5, mode=mode,
+                                           backend=b)
+                       for b in ['edt', 'fft', 'ndimage']]
+                assert sp.all(res[0] == res[1])
+                assert sp.all(res[0] == res[2])
+
+    def test_morphology_choose_backend(self):
+        from porespy.tools.__funcs__ import _choose_backend
+        assert _choose_backend([100, 100], 1) == 'ndimage'
+        assert _choose_backend([100, 100, 100], 1) == 'ndimage'
+        assert _choose_backend([200, 200, 200], 12) == 'fft'
+        assert _choose_backend([300, 300, 300], 20) == 'fft'
+        assert _choose_backend([100, 100, 100], 50) == 'edt'
+        im = self.im3D
+        a = ps.tools.morphology(im, radius=20, mode='opening')
+        b = ps.tools.morphology(im, radius=20, mode='opening', backend='edt')
+        assert sp.all(a == b)
+
+    def test_label_parallel(self):
+        strel = spim.generate_binary_structure(3, 3)
+        labels, N = spim.label(self.im3D, structure=strel)
+        tup = ps.tools.label_parallel(self.im3D, structure=strel, divs=5,
+                                      num_workers=1)
+        assert tup.N == N
+        # Each label must map onto exactly one label of scipy's result
+        pairs = sp.unique(labels*(N + 1) + tup.labels)
+        assert pairs.size == N + 1
+        assert sp.all(tup.faces[sp.unique(tup.labels[0]), 0][1:])
+        assert sp.all(tup.faces[sp.unique(tup.labels[:, :, -1]), 5][1:])
+        assert not sp.any(tup.faces[0])
+
+    def test_label_parallel_no_cross_slab_offsets(self):
+        # A line structuring element along axis 1 never connects slabs
+        strel = sp.zeros([3, 3, 3], dtype=bool)
+        strel[1, :, 1] = True
+        labels, N = spim.label(self.im3D, structure=strel)
+        tup = ps.tools.label_parallel(self.im3D, structure=strel, divs=3,
+                                      num_workers=1)
+        assert tup.N == N
+
 
 if __name__ == '__main__':
     t = ToolsTest()